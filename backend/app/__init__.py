@@ -1 +1,5 @@
-# App package 
\ No newline at end of file
+# App package
+from dotenv import load_dotenv
+
+# Load backend/.env before any app module reads its settings at import time
+load_dotenv()
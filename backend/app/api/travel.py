@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException
-from ..models import TravelRequest, TravelPlan
+import os
+import time
+import asyncio
+import orjson
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from ..models import BatchRequest, ReplanRequest, TravelRequest, TravelPlan
 from ..services.ai_service import AIService
+from ..services.cache_warmer import cache_warmer
+from ..services.jobs import BATCH_MAX_REQUESTS, batch_runner
+from ..services.metrics import REQUEST_SECONDS, REQUEST_TOKENS, shared_metrics, stage, track_tokens
 
 # Create router for travel-related endpoints
 router = APIRouter(
@@ -9,13 +18,242 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+def token_headers(tokens: dict) -> dict:
+    return {
+        "X-Prompt-Tokens": str(tokens["prompt"]),
+        "X-Output-Tokens": str(tokens["output"]),
+        "X-Token-Usage": "estimated" if tokens["estimated"] else "reported",
+    }
+
+
+def observe_tokens(tokens: dict, route: str) -> None:
+    REQUEST_TOKENS.observe(tokens["prompt"], route=route, kind="prompt")
+    REQUEST_TOKENS.observe(tokens["output"], route=route, kind="output")
+
+
 @router.post("/generate-plan", response_model=TravelPlan)
 async def generate_travel_plan(request: TravelRequest):
     """
-    Generate a travel plan based on the provided request details.
+    Generate a travel plan based on the provided request details. The upstream
+    tokens it took are reported in X-Prompt-Tokens and X-Output-Tokens (0 when
+    served from the cache); X-Token-Usage says whether the provider reported
+    them or they were estimated from text length.
     """
+    start = time.perf_counter()
+    outcome = "error"
+    tokens = track_tokens()
+    cache_warmer.record(request)
     try:
+        # The service returns an already validated plan; serve it as a ready
+        # response so FastAPI doesn't validate it a second time
         travel_plan = await AIService.generate_travel_plan(request)
-        return travel_plan
+
+        # Keep the plan so it can be fetched again by id without regenerating
+        with stage("serialization"):
+            plan_id, etag, payload = await asyncio.to_thread(AIService.store.save, request, travel_plan)
+        outcome = "success"
+        return Response(
+            content=payload,
+            media_type="application/json",
+            headers={"ETag": etag, "Location": f"/travel/plans/{plan_id}", **token_headers(tokens)}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route="generate_plan", outcome=outcome)
+        observe_tokens(tokens, "generate_plan")
+
+
+@router.post("/generate-plan/stream")
+async def stream_travel_plan(request: TravelRequest):
+    """
+    Stream a travel plan as newline-delimited JSON events. Each itinerary day,
+    accommodation, transport option and activity is sent as soon as it is complete.
+    The final "done" event carries the upstream token usage, with "estimated"
+    set when it was estimated from text length.
+    """
+    cache_warmer.record(request)
+
+    async def events():
+        tokens = track_tokens()
+        try:
+            async for event in AIService.stream_travel_plan(request):
+                if event["type"] == "done":
+                    event["usage"] = {key: tokens[key] for key in ("prompt", "output", "estimated")}
+                    observe_tokens(tokens, "generate_plan_stream")
+                yield orjson.dumps(event) + b"\n"
+        except HTTPException as e:
+            event = {"type": "error", "status_code": e.status_code, "detail": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                event["retry_after"] = int(e.headers["Retry-After"])
+            yield orjson.dumps(event) + b"\n"
+        except Exception as e:
+            yield orjson.dumps({"type": "error", "status_code": 500, "detail": str(e)}) + b"\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+@router.get("/plans")
+async def list_plans(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    destination: Optional[str] = None,
+    start_from: Optional[str] = None,
+    start_to: Optional[str] = None,
+):
+    """
+    List stored plans, newest first. Pass the returned next_cursor to get the next page.
+    """
+    try:
+        plans, next_cursor = AIService.store.list(limit, cursor, destination, start_from, start_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"plans": plans, "next_cursor": next_cursor}
+
+
+@router.get("/plans/{plan_id}", response_model=TravelPlan)
+async def get_plan(plan_id: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Fetch a stored plan by id. Supports If-None-Match, answering 304 when the
+    client's copy is current.
+    """
+    headers = {"Cache-Control": "no-cache"}
+    if if_none_match:
+        etag = AIService.store.etag(plan_id)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={**headers, "ETag": etag})
+
+    row = AIService.store.get(plan_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Plan '{plan_id}' not found")
+    return Response(content=row["plan"], media_type="application/json", headers={**headers, "ETag": row["etag"]})
+
+
+@router.post("/plans/{plan_id}/replan", response_model=TravelPlan)
+async def replan(plan_id: str, delta: ReplanRequest):
+    """
+    Apply a change (dates, interests, budget, travelers, swapped hotels or days
+    to redo) to a stored plan, regenerating only the affected parts. The result
+    is stored as a new plan; upstream tokens are reported as for generate-plan.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    tokens = track_tokens()
+    try:
+        row = AIService.store.get(plan_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"Plan '{plan_id}' not found")
+
+        request = TravelRequest.parse_raw(row["request"])
+        new_request, travel_plan = await AIService.replan_travel_plan(request, orjson.loads(row["plan"]), delta)
+
+        with stage("serialization"):
+            new_id, etag, payload = await asyncio.to_thread(AIService.store.save, new_request, travel_plan)
+        outcome = "success"
+        return Response(
+            content=payload,
+            media_type="application/json",
+            headers={"ETag": etag, "Location": f"/travel/plans/{new_id}", **token_headers(tokens)}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route="replan", outcome=outcome)
+        observe_tokens(tokens, "replan")
+
+
+@router.post("/plans:batch", status_code=202)
+async def submit_batch(batch: BatchRequest):
+    """
+    Queue many plan requests as one background job and return its id at once.
+    Poll /travel/jobs/{job_id} or stream /travel/jobs/{job_id}/results for the plans.
+    """
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {BATCH_MAX_REQUESTS} requests")
+
+    job_id = batch_runner.submit(batch.requests)
+    return ORJSONResponse(
+        batch_runner.queue.summary(job_id),
+        status_code=202,
+        headers={"Location": f"/travel/jobs/{job_id}"}
+    )
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Progress of a batch job, with the plan id or error of every finished request.
+    """
+    summary = batch_runner.queue.summary(job_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return {**summary, "results": batch_runner.queue.results(job_id)}
+
+
+@router.get("/jobs/{job_id}/results")
+async def stream_job_results(job_id: str):
+    """
+    Stream a batch job's results as newline-delimited JSON, each plan (or error)
+    as soon as it finishes, then a final summary once every request is done.
+    """
+    if batch_runner.queue.summary(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+
+    async def events():
+        sent = 0
+        while True:
+            summary = batch_runner.queue.summary(job_id)
+            for result in batch_runner.queue.results(job_id, sent):
+                sent += 1
+                if result["status"] == "done":
+                    row = AIService.store.get(result["plan_id"])
+                    result["plan"] = orjson.loads(row["plan"]) if row else None
+                yield orjson.dumps({"type": "result", **result}) + b"\n"
+            if summary["status"] == "completed" and sent >= summary["total"]:
+                yield orjson.dumps({"type": "done", **summary}) + b"\n"
+                return
+            await batch_runner.wait_for_progress(1.0)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters for the travel plan cache and request coalescing, and
+    the state of cache warming. With shared metrics, hits, misses and
+    deduplicated are totals over all worker processes; the other fields
+    describe the worker that answered, identified by `worker`.
+    """
+    stats = {
+        **AIService.cache.stats(),
+        "deduplicated": AIService.inflight.deduplicated,
+        "in_flight": AIService.inflight.in_flight(),
+        "admission_queue_length": AIService.admission.waiting,
+        "warming": cache_warmer.stats(),
+        "worker": os.getpid(),
+    }
+    if shared_metrics.enabled:
+        totals = await shared_metrics.totals(
+            "travel_plan_cache_hits_total", "travel_plan_cache_misses_total", "travel_plan_deduplicated_total"
+        )
+        hits = int(totals["travel_plan_cache_hits_total"])
+        misses = int(totals["travel_plan_cache_misses_total"])
+        stats.update(
+            hits=hits,
+            misses=misses,
+            hit_ratio=round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            deduplicated=int(totals["travel_plan_deduplicated_total"]),
+        )
+    return stats
@@ -1,33 +1,80 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from .api import api_router
+from .logging_config import configure_logging
+from .services.cache_warmer import cache_warmer
+from .services.jobs import batch_runner
+from .services.metrics import shared_metrics
 
-# Create FastAPI instance
-app = FastAPI(
-    title="Travel Planning AI Agent",
-    description="API for generating personalized travel plans using AI",
-    version="1.0.0",
-)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods
-    allow_headers=["*"],  # Allows all headers
-)
-
-# Root endpoint
-@app.get("/")
-async def root():
-    return {
-        "message": "Travel Planning AI Agent API",
-        "docs": "/docs",
-        "endpoints": {
-            "generate_plan": "/travel/generate-plan"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resume batch jobs left unfinished by a previous run, warm the plan cache
+    # for popular requests off-peak (when CACHE_WARMING=on), and publish this
+    # worker's metrics to the shared file (when METRICS_STATE_PATH is set)
+    batch_runner.start()
+    cache_warmer.start()
+    shared_metrics.start()
+    yield
+    await cache_warmer.stop()
+    await batch_runner.stop()
+    await shared_metrics.stop()
+
+
+def create_app() -> FastAPI:
+    """
+    Build the FastAPI application. The Gemini SDK and model client are created
+    lazily on the first generation, so building the app is cheap and needs no API key.
+    """
+    # Structured (JSON) application logs
+    configure_logging()
+
+    # Create FastAPI instance
+    app = FastAPI(
+        title="Travel Planning AI Agent",
+        description="API for generating personalized travel plans using AI",
+        version="1.0.0",
+        lifespan=lifespan,
+        # Serialize JSON responses with orjson
+        default_response_class=ORJSONResponse,
+    )
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allows all origins
+        allow_credentials=True,
+        allow_methods=["*"],  # Allows all methods
+        allow_headers=["*"],  # Allows all headers
+    )
+
+    # Root endpoint
+    @app.get("/")
+    async def root():
+        return {
+            "message": "Travel Planning AI Agent API",
+            "docs": "/docs",
+            "endpoints": {
+                "generate_plan": "/travel/generate-plan",
+                "generate_plan_stream": "/travel/generate-plan/stream",
+                "plans": "/travel/plans",
+                "batch": "/travel/plans:batch",
+                "metrics": "/metrics"
+            }
         }
-    }
 
-# Include API routes
-app.include_router(api_router) 
\ No newline at end of file
+    # Prometheus metrics endpoint, pooled across worker processes when shared
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(await shared_metrics.render(), media_type="text/plain; version=0.0.4")
+
+    # Include API routes
+    app.include_router(api_router)
+
+    return app
+
+
+# Default application instance for `uvicorn app.main:app`
+app = create_app()
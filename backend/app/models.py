@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Extra, Field
+from typing import List, Optional, Union
 
 class TravelRequest(BaseModel):
     source: str
@@ -26,22 +26,54 @@ class TravelRequest(BaseModel):
         }
     }
 
+# Changes to a stored plan's request; unset fields keep their original value
+class ReplanRequest(BaseModel):
+    source: Optional[str] = None
+    destination: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    budget: Optional[float] = None
+    travelers: Optional[int] = None
+    interests: Optional[List[str]] = None
+    regenerate_days: List[int] = []
+    replace_accommodation: List[str] = []
+
+# Many plan requests submitted as one background job
+class BatchRequest(BaseModel):
+    requests: List[TravelRequest] = Field(..., min_items=1)
+
+# Plan sections are typed but allow extra fields, since the model often adds
+# its own (meals, duration, location, ...). Prices stay as written ("₹3,500").
 class ActivityItem(BaseModel):
+    id: Optional[str] = None
     name: str
     category: str
-    description: str
+    description: Optional[str] = None
+    estimated_cost: Optional[str] = None
+    duration: Optional[str] = None
+
+    class Config:
+        extra = Extra.allow
 
 class DailyPlan(BaseModel):
     day: int
     date: str
     title: Optional[str] = None
-    activities: List[Dict[str, Any]]
+    # Scheduled items are free-form (time, description, ...) or plain text; a
+    # plain dict check here is much cheaper than validating Dict[str, Any]
+    activities: List[Union[dict, str]] = []
+
+    class Config:
+        extra = Extra.allow
 
 class Accommodation(BaseModel):
     name: str
     type: str
     price_per_night: str
-    description: str
+    description: Optional[str] = None
+
+    class Config:
+        extra = Extra.allow
 
 class Transportation(BaseModel):
     type: str
@@ -50,6 +82,11 @@ class Transportation(BaseModel):
     estimated_price: str
     details: Optional[str] = None
 
+    class Config:
+        extra = Extra.allow
+        allow_population_by_field_name = True
+
+# Computed by the cost engine: formatted lines plus their numeric amounts
 class CostBreakdown(BaseModel):
     accommodation: str
     transportation: str
@@ -57,10 +94,25 @@ class CostBreakdown(BaseModel):
     food: str
     miscellaneous: Optional[str] = None
     total: str
+    accommodation_amount: float
+    transportation_amount: float
+    activities_amount: float
+    food_amount: float
+    miscellaneous_amount: float
+    total_amount: float
+    budget_amount: float
+    over_budget: bool
+
+    class Config:
+        extra = Extra.allow
 
 class TravelPlan(BaseModel):
-    itinerary: List[Dict[str, Any]]
-    accommodation_suggestions: List[Dict[str, Any]]
-    transportation_options: List[Dict[str, Any]]
-    estimated_costs: Dict[str, Any]
-    activities: List[Dict[str, Any]] 
\ No newline at end of file
+    itinerary: List[DailyPlan]
+    accommodation_suggestions: List[Accommodation]
+    transportation_options: List[Transportation]
+    estimated_costs: CostBreakdown
+    activities: List[ActivityItem]
+    plan_id: Optional[str] = None
+
+    class Config:
+        extra = Extra.allow
@@ -0,0 +1,317 @@
+import os
+import asyncio
+import math
+import time
+import logging
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds a shared bucket waits for another worker's transaction before
+# giving up; callers turn that into a fast 429 rather than a long wait
+BUCKET_BUSY_TIMEOUT_MS = 250
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request can't be admitted before its deadline.
+    """
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if they are now).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def try_take(self, amount: float) -> float:
+        """
+        Take `amount` tokens if they are available now; otherwise return the wait.
+        """
+        wait = self.wait_time(amount)
+        if wait == 0:
+            self.take(amount)
+        return wait
+
+    def adjust(self, amount: float) -> None:
+        """
+        Charge (positive) or refund (negative) tokens after the fact.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket kept in a SQLite file (WAL mode), so every worker process on the
+    host draws from the same quota. Each operation refills and updates the row in
+    one immediate transaction, using wall-clock time since the row is shared.
+    Operations block on file I/O and may raise sqlite3.OperationalError when
+    other workers hold the file for too long, so async callers run them in a
+    thread (see AdmissionController and CacheWarmer).
+    """
+
+    def __init__(self, db: sqlite3.Connection, name: str, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(capacity, 1.0)
+        self.name = name
+        self._db = db
+        with self._db.lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute(
+                "INSERT OR IGNORE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, self.capacity, time.time()),
+            )
+
+    def _update(self, change) -> float:
+        """
+        Refill, apply `change(tokens) -> tokens` and store the result, atomically.
+        """
+        with self._db.lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            tokens, updated = self._db.execute(
+                "SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            tokens = change(min(self.capacity, tokens + max(now - updated, 0.0) * self.rate))
+            self._db.execute(
+                "UPDATE token_buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name)
+            )
+        return tokens
+
+    @property
+    def tokens(self) -> float:
+        return self._update(lambda tokens: tokens)
+
+    def wait_time(self, amount: float) -> float:
+        tokens = self.tokens
+        amount = min(amount, self.capacity)
+        if tokens >= amount:
+            return 0.0
+        return (amount - tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._update(lambda tokens: tokens - min(amount, self.capacity))
+
+    def try_take(self, amount: float) -> float:
+        """
+        Check and take in the same transaction, so two workers can't both take the last tokens.
+        """
+        amount = min(amount, self.capacity)
+        wait = 0.0
+
+        def change(tokens: float) -> float:
+            nonlocal wait
+            if tokens >= amount:
+                return tokens - amount
+            wait = (amount - tokens) / self.rate
+            return tokens
+
+        self._update(change)
+        return wait
+
+    def adjust(self, amount: float) -> None:
+        self._update(lambda tokens: min(self.capacity, tokens - amount))
+
+
+class BucketStore(sqlite3.Connection):
+    """
+    Connection to the shared bucket file; `lock` keeps transactions from
+    different threads of one process apart.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+
+
+def open_bucket_store(path: str) -> BucketStore:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, factory=BucketStore)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(f"PRAGMA busy_timeout={BUCKET_BUSY_TIMEOUT_MS}")
+    db.execute("CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+    return db
+
+
+class AdmissionController:
+    """
+    Admission control in front of the upstream model.
+
+    Requests-per-minute and tokens-per-minute buckets are sized to the configured
+    quota. Requests that can't go immediately wait in a bounded FIFO queue with a
+    deadline. When the queue is full, or the expected wait is already past the
+    deadline, the request is rejected straight away with a Retry-After hint, so
+    overload produces fast rejections instead of slow upstream failures.
+    A rate of 0 disables that bucket. With a `state_path` the buckets live in a
+    shared SQLite file, so several worker processes stay within one quota; the
+    wait queue itself stays per process. Shared buckets are then checked in a
+    thread, off the event loop, and a bucket file held busy by other workers
+    rejects the request instead of stalling.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_queue: int,
+        max_wait: float,
+        burst_seconds: float = 10.0,
+        state_path: Optional[str] = None,
+    ):
+        db = open_bucket_store(state_path) if state_path else None
+
+        def bucket(name: str, rate_per_minute: float):
+            if rate_per_minute <= 0:
+                return None
+            capacity = rate_per_minute * burst_seconds / 60.0
+            if db is not None:
+                return SharedTokenBucket(db, name, rate_per_minute, capacity)
+            return TokenBucket(rate_per_minute, capacity)
+
+        self.shared = db is not None
+        self.requests = bucket("requests", requests_per_minute)
+        self.tokens = bucket("tokens", tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.rejected = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _wait_time(self, tokens: float) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _try_take(self, tokens: float) -> float:
+        """
+        Take a request and `tokens` tokens if both are available now; otherwise return the wait.
+        """
+        wait = self.requests.try_take(1) if self.requests is not None else 0.0
+        if wait == 0 and self.tokens is not None:
+            wait = self.tokens.try_take(tokens)
+            if wait and self.requests is not None:
+                # Give the request token back
+                self.requests.adjust(-1)
+        return wait
+
+    async def _off_loop(self, call: Callable[..., float], *args) -> float:
+        """
+        Run a bucket operation, in a thread for shared buckets. A busy bucket
+        file becomes an AdmissionRejected.
+        """
+        if not self.shared:
+            return call(*args)
+        try:
+            return await asyncio.to_thread(call, *args)
+        except sqlite3.OperationalError as e:
+            logger.warning("admission_state_busy", extra={"error": str(e)})
+            raise self._reject(1.0, "Upstream quota state is busy")
+
+    def _expected_queue_wait(self) -> float:
+        # Everyone ahead of us needs at least one request token
+        if self.requests is None:
+            return 0.0
+        return self.waiting / self.requests.rate
+
+    def _reject(self, retry_after: float, reason: str) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(max(retry_after, 1.0), reason)
+
+    async def admit(self, tokens: float) -> None:
+        """
+        Wait until the request fits the quota, or raise AdmissionRejected.
+        """
+        if self.requests is None and self.tokens is None:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # Fast path: nobody queued and capacity is available
+        if self.waiting == 0 and await self._off_loop(self._try_take, tokens) == 0:
+            return
+
+        if self.waiting >= self.max_queue:
+            raise self._reject(self._expected_queue_wait(), "Admission queue is full")
+
+        expected = self._expected_queue_wait() + await self._off_loop(self._wait_time, tokens)
+        if expected > self.max_wait:
+            raise self._reject(expected, "Upstream quota exhausted")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        self.waiting += 1
+        try:
+            try:
+                # The lock keeps waiters in FIFO order
+                await asyncio.wait_for(self._lock.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                raise self._reject(self._expected_queue_wait(), "Timed out waiting for upstream quota")
+
+            try:
+                while True:
+                    wait = await self._off_loop(self._try_take, tokens)
+                    if wait == 0:
+                        return
+                    if loop.time() + wait > deadline:
+                        raise self._reject(wait, "Timed out waiting for upstream quota")
+                    await asyncio.sleep(wait)
+            finally:
+                self._lock.release()
+        finally:
+            self.waiting -= 1
+
+    async def settle(self, estimated_tokens: float, actual_tokens: float) -> None:
+        """
+        Correct the token bucket once the real usage of a call is known.
+        """
+        if self.tokens is None or not actual_tokens:
+            return
+        try:
+            if self.shared:
+                await asyncio.to_thread(self.tokens.adjust, actual_tokens - estimated_tokens)
+            else:
+                self.tokens.adjust(actual_tokens - estimated_tokens)
+        except sqlite3.OperationalError as e:
+            # The estimate stays charged instead
+            logger.warning("admission_settle_skipped", extra={"error": str(e)})
+
+    def retry_after(self) -> int:
+        return math.ceil(max(self._expected_queue_wait(), 1.0))
@@ -1,126 +1,985 @@
 import os
 import json
-import re
-import google.generativeai as genai
+import asyncio
+import copy
+import math
+import logging
+from datetime import date, timedelta
+from typing import AsyncIterator, Callable, Dict, List, Optional
 from fastapi import HTTPException
-from dotenv import load_dotenv
-from ..models import TravelRequest
+from pydantic import ValidationError
+from ..models import ReplanRequest, TravelPlan, TravelRequest
+from .plan_cache import PlanCache, cache_key, restamp_dates, trip_days
+from .plan_store import PlanStore
+from .single_flight import SingleFlight
+from .json_stream import IncrementalPlanParser
+from .json_repair import extract_json, parse_llm_json
+from .cost_engine import apply_cost_breakdown
+from .catalog import CatalogMatch, match_request
+from .replan import apply_delta, merge_days, prepare_replan
+from . import prompt_compiler
+from .prompt_compiler import (
+    ACCOMMODATION_COUNT, MAX_OUTPUT_TOKENS, TRANSPORT_COUNT,
+    expand_response, join, output_budget, plan_entries, recommended_activities,
+)
+from .admission import AdmissionController, AdmissionRejected
+from .resilience import CircuitBreaker, CircuitOpen, hedge, retry_with_backoff
+from .providers import LLMProvider, create_provider
+from .metrics import (
+    ERRORS, HEDGES, IN_FLIGHT, JSON_REPAIRS, QUEUE_DEPTH, RETRIES, STAGE_SECONDS, UPSTREAM_TOKENS,
+    Counter, Gauge, add_request_tokens, add_upstream_call, registry, stage,
+)
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Setup API key and configure genai
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("Missing GEMINI_API_KEY environment variable")
+# Upper bound on concurrent Gemini calls and how long a request may wait for a slot
+MAX_CONCURRENT_REQUESTS = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "30"))
 
-genai.configure(api_key=api_key)
+# Upstream quota for admission control (0 disables a limit), the bounded wait
+# queue in front of it, and the output size assumed before usage is known
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+ESTIMATED_OUTPUT_TOKENS = int(os.getenv("ESTIMATED_OUTPUT_TOKENS", "4000"))
+# SQLite file holding the quota buckets, shared by every worker process (unset: per process)
+ADMISSION_STATE_PATH = os.getenv("ADMISSION_STATE_PATH") or None
+
+# Resilience: per-attempt timeout, retries with jittered backoff, hedging and
+# the circuit breaker. PLAN_HEDGE_DELAY is "auto" (observed upstream p95),
+# "off", or a fixed number of seconds.
+ATTEMPT_TIMEOUT = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT", "45"))
+MAX_RETRIES = int(os.getenv("PLAN_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY = float(os.getenv("PLAN_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("PLAN_RETRY_MAX_DELAY", "4"))
+HEDGE_DELAY = os.getenv("PLAN_HEDGE_DELAY", "auto")
+HEDGE_MIN_SAMPLES = int(os.getenv("PLAN_HEDGE_MIN_SAMPLES", "20"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Upstream errors worth another attempt
+TRANSIENT_ERRORS = {
+    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+    "Aborted", "Unknown", "GatewayTimeout",
+}
+
+# Plan cache settings; PLAN_CACHE_PATH enables the on-disk tier
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "1024"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "86400"))
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH") or None
+
+# SQLite file keeping every plan served, for fetching by id, and the days a
+# plan is kept after it was last served (0 keeps plans forever)
+PLAN_STORE_PATH = os.getenv("PLAN_STORE_PATH", "plans.db")
+PLAN_STORE_RETENTION_DAYS = float(os.getenv("PLAN_STORE_RETENTION_DAYS", "90"))
+
+# Generation mode: "single" prompt, "chunked" skeleton-then-days, or "auto"
+# to use chunked generation for trips of at least CHUNKED_MIN_DAYS days
+GENERATION_MODE = os.getenv("PLAN_GENERATION_MODE", "auto")
+CHUNKED_MIN_DAYS = int(os.getenv("PLAN_CHUNKED_MIN_DAYS", "10"))
+CHUNK_DAYS = int(os.getenv("PLAN_CHUNK_DAYS", "7"))
+
+# Default sampling settings for plan generation
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+}
+
+# Sections of a travel plan, in the order they are generated
+PLAN_SECTIONS = [
+    "itinerary", 
+    "accommodation_suggestions", 
+    "transportation_options", 
+    "estimated_costs", 
+    "activities"
+]
+
+# Fields the model must return; estimated_costs is computed locally
+REQUIRED_FIELDS = [field for field in PLAN_SECTIONS if field != "estimated_costs"]
+
+# Sections whose invalid entries can be dropped instead of failing the plan
+DROPPABLE_SECTIONS = ["accommodation_suggestions", "transportation_options", "activities"]
+
+# With a catalog match, accommodation comes from the catalog's hotel tiers
+CATALOG_REQUIRED_FIELDS = [field for field in REQUIRED_FIELDS if field != "accommodation_suggestions"]
 
 class AIService:
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _provider: Optional[LLMProvider] = None
+    cache = PlanCache(
+        max_entries=PLAN_CACHE_MAX_ENTRIES,
+        ttl=PLAN_CACHE_TTL,
+        path=PLAN_CACHE_PATH,
+    )
+    store = PlanStore(PLAN_STORE_PATH, retention=PLAN_STORE_RETENTION_DAYS * 86400)
+    inflight = SingleFlight()
+    admission = AdmissionController(
+        requests_per_minute=GEMINI_RPM,
+        tokens_per_minute=GEMINI_TPM,
+        max_queue=ADMISSION_MAX_QUEUE,
+        max_wait=ADMISSION_MAX_WAIT,
+        state_path=ADMISSION_STATE_PATH,
+    )
+    breaker = CircuitBreaker(
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    )
+
+    @classmethod
+    def _get_semaphore(cls) -> asyncio.Semaphore:
+        """
+        Lazily create the semaphore so it binds to the running event loop.
+        """
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return cls._semaphore
+
+    @classmethod
+    def get_provider(cls) -> LLMProvider:
+        """
+        Create the LLM provider selected by LLM_PROVIDER on first use, then reuse it.
+        """
+        if cls._provider is None:
+            cls._provider = create_provider()
+        return cls._provider
+
+    @staticmethod
+    def generation_config(entries: Dict[str, int], compact: Optional[bool] = None) -> dict:
+        """
+        Sampling settings for a response holding the given entries per kind, with
+        max_output_tokens sized to them (see prompt_compiler.output_budget).
+        """
+        max_output_tokens = output_budget(entries, compact)
+        if max_output_tokens is None:
+            return GENERATION_CONFIG
+        return {**GENERATION_CONFIG, "max_output_tokens": max_output_tokens}
+
+    @staticmethod
+    async def _admit(prompt: str, generation_config: dict) -> int:
+        """
+        Pass admission control for one upstream call, or fail fast with a 429.
+        Returns the token estimate charged against the quota: the prompt plus
+        the output budget, or ESTIMATED_OUTPUT_TOKENS if that is smaller.
+        """
+        output_tokens = min(ESTIMATED_OUTPUT_TOKENS, generation_config.get("max_output_tokens") or ESTIMATED_OUTPUT_TOKENS)
+        estimated_tokens = len(prompt) // 4 + output_tokens
+        try:
+            await AIService.admission.admit(estimated_tokens)
+        except AdmissionRejected as e:
+            ERRORS.inc(type="AdmissionRejected")
+            logger.warning("admission_rejected", extra={"reason": e.reason, "retry_after": e.retry_after})
+            raise HTTPException(
+                status_code=429,
+                detail=f"{e.reason}. Please retry shortly.",
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+        return estimated_tokens
+
+    @staticmethod
+    def _is_quota_error(error: Exception) -> bool:
+        return type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+    @staticmethod
+    def _record_upstream_failure(error: Exception) -> None:
+        """
+        Count a failed upstream call towards the circuit breaker. Quota errors
+        mean the upstream is up but busy, so they end the call without an outcome
+        instead of opening the circuit.
+        """
+        if AIService._is_quota_error(error):
+            AIService.breaker.abandon()
+        else:
+            AIService.breaker.record_failure()
+
+    @staticmethod
+    def _upstream_error(error: Exception) -> Exception:
+        """
+        Turn an upstream quota error into a 429 instead of a generic 500.
+        """
+        if AIService._is_quota_error(error):
+            ERRORS.inc(type="UpstreamQuotaExceeded")
+            return HTTPException(
+                status_code=429,
+                detail="The AI provider's rate limit was reached. Please retry shortly.",
+                headers={"Retry-After": str(AIService.admission.retry_after())}
+            )
+        return error
+
+    @staticmethod
+    def _circuit_open_error(error: CircuitOpen) -> HTTPException:
+        ERRORS.inc(type="CircuitOpen")
+        return HTTPException(
+            status_code=503,
+            detail="The AI provider is temporarily unavailable. Please retry shortly.",
+            headers={"Retry-After": str(math.ceil(error.retry_after))}
+        )
+
+    @staticmethod
+    def hedge_delay() -> Optional[float]:
+        """
+        Seconds to wait before hedging an upstream attempt, or None to not hedge.
+        """
+        if HEDGE_DELAY == "off":
+            return None
+        if HEDGE_DELAY != "auto":
+            return float(HEDGE_DELAY)
+        # Only hedge once there are enough samples for a meaningful p95
+        if STAGE_SECONDS.count(stage="upstream") < HEDGE_MIN_SAMPLES:
+            return None
+        return STAGE_SECONDS.quantile(0.95, stage="upstream")
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (asyncio.TimeoutError, json.JSONDecodeError, ValueError)):
+            return True
+        return type(error).__name__ in TRANSIENT_ERRORS
+
+    @staticmethod
+    async def generate_json(prompt: str, parse: Callable[[str], dict], generation_config: Optional[dict] = None) -> dict:
+        """
+        Generate and parse one JSON response. Each attempt is hedged with a second
+        copy once it runs past the hedge delay, and transient upstream errors,
+        timeouts and unparseable output are retried with jittered backoff.
+        Unparseable output may have been cut off at max_output_tokens, so its
+        retry gets twice the output budget (up to MAX_OUTPUT_TOKENS).
+        """
+        config = {"current": generation_config}
+
+        async def attempt() -> dict:
+            response = await AIService.generate_content(prompt, config["current"])
+            try:
+                return parse(response.text)
+            except (json.JSONDecodeError, ValueError) as e:
+                logger.warning("unparseable_ai_response", extra={"error": str(e), "response_text": response.text})
+                raise
+
+        def on_hedge():
+            HEDGES.inc()
+
+        def on_retry(error: Exception, number: int):
+            RETRIES.inc(reason=type(error).__name__)
+            max_output_tokens = (config["current"] or {}).get("max_output_tokens")
+            if max_output_tokens and isinstance(error, ValueError):
+                config["current"] = {
+                    **config["current"], "max_output_tokens": min(max_output_tokens * 2, MAX_OUTPUT_TOKENS)
+                }
+            logger.warning("retrying_generation", extra={"attempt": number + 1, "error": repr(error)})
+
+        return await retry_with_backoff(
+            lambda: hedge(attempt, AIService.hedge_delay(), on_hedge),
+            retries=MAX_RETRIES,
+            base_delay=RETRY_BASE_DELAY,
+            max_delay=RETRY_MAX_DELAY,
+            is_retryable=AIService._is_retryable,
+            on_retry=on_retry,
+        )
+
+    @staticmethod
+    async def _acquire_slot() -> asyncio.Semaphore:
+        """
+        Wait for a free upstream slot, raising a 503 after QUEUE_TIMEOUT seconds.
+        """
+        semaphore = AIService._get_semaphore()
+        QUEUE_DEPTH.inc()
+        try:
+            with stage("queue_wait"):
+                await asyncio.wait_for(semaphore.acquire(), timeout=QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            ERRORS.inc(type="QueueTimeout")
+            logger.warning("upstream_queue_timeout", extra={"queue_timeout": QUEUE_TIMEOUT})
+            raise HTTPException(
+                status_code=503,
+                detail="Too many travel plans are being generated right now. Please try again shortly."
+            )
+        finally:
+            QUEUE_DEPTH.dec()
+        return semaphore
+
+    @staticmethod
+    async def _record_usage(response, estimated_tokens: int) -> None:
+        """
+        Count the prompt and output tokens from the response's usage metadata, if
+        present, towards the totals and the current request, and settle the
+        admission estimate against them. Usage the provider estimated is counted
+        under source="estimated".
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        estimated = getattr(usage, "estimated", False)
+        source = "estimated" if estimated else "reported"
+        UPSTREAM_TOKENS.inc(prompt_tokens, kind="prompt", source=source)
+        UPSTREAM_TOKENS.inc(output_tokens, kind="output", source=source)
+        add_request_tokens(prompt_tokens, output_tokens, estimated)
+        await AIService.admission.settle(estimated_tokens, prompt_tokens + output_tokens)
+
+    @staticmethod
+    async def generate_content(prompt: str, generation_config: Optional[dict] = None):
+        """
+        Call the model without blocking the event loop, bounded by MAX_CONCURRENT_REQUESTS.
+        Raises a 429 if admission control rejects the call, and a 503 if the
+        circuit breaker is open or no slot frees up within QUEUE_TIMEOUT seconds.
+        Each call is limited to ATTEMPT_TIMEOUT seconds.
+        """
+        try:
+            AIService.breaker.check()
+        except CircuitOpen as e:
+            raise AIService._circuit_open_error(e)
+
+        generation_config = generation_config or GENERATION_CONFIG
+        estimated_tokens = await AIService._admit(prompt, generation_config)
+        semaphore = await AIService._acquire_slot()
+        IN_FLIGHT.inc()
+        try:
+            provider = AIService.get_provider()
+            try:
+                AIService.breaker.before_call()
+            except CircuitOpen as e:
+                raise AIService._circuit_open_error(e)
+
+            # Providers are async so the worker keeps serving other requests
+            add_upstream_call()
+            with stage("upstream"):
+                try:
+                    response = await asyncio.wait_for(
+                        provider.generate(prompt, generation_config),
+                        timeout=ATTEMPT_TIMEOUT
+                    )
+                except asyncio.CancelledError:
+                    AIService.breaker.abandon()
+                    raise
+                except Exception as e:
+                    AIService._record_upstream_failure(e)
+                    raise AIService._upstream_error(e) from e
+            AIService.breaker.record_success()
+            await AIService._record_usage(response, estimated_tokens)
+            return response
+        finally:
+            IN_FLIGHT.dec()
+            semaphore.release()
+
+    @staticmethod
+    async def stream_content(prompt: str, generation_config: Optional[dict] = None) -> AsyncIterator[str]:
+        """
+        Stream the model's response text chunk by chunk, holding an upstream slot
+        until the stream is exhausted. Admission, the circuit breaker and errors
+        are handled as in generate_content; each chunk must arrive within
+        ATTEMPT_TIMEOUT seconds, so a hung stream gives its slot back.
+        """
+        try:
+            AIService.breaker.check()
+        except CircuitOpen as e:
+            raise AIService._circuit_open_error(e)
+
+        generation_config = generation_config or GENERATION_CONFIG
+        estimated_tokens = await AIService._admit(prompt, generation_config)
+        semaphore = await AIService._acquire_slot()
+        IN_FLIGHT.inc()
+        try:
+            provider = AIService.get_provider()
+            try:
+                AIService.breaker.before_call()
+            except CircuitOpen as e:
+                raise AIService._circuit_open_error(e)
+
+            last_chunk = None
+            add_upstream_call()
+            chunks = provider.stream(prompt, generation_config).__aiter__()
+            with stage("upstream_stream"):
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=ATTEMPT_TIMEOUT)
+                        except StopAsyncIteration:
+                            break
+                        last_chunk = chunk
+                        yield chunk.text
+                except (asyncio.CancelledError, GeneratorExit):
+                    AIService.breaker.abandon()
+                    raise
+                except Exception as e:
+                    AIService._record_upstream_failure(e)
+                    raise AIService._upstream_error(e) from e
+                finally:
+                    # Stop the upstream stream too if it was abandoned midway
+                    aclose = getattr(chunks, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+            AIService.breaker.record_success()
+            # Usage, when the provider reports it, arrives with the last chunk
+            if last_chunk is not None:
+                await AIService._record_usage(last_chunk, estimated_tokens)
+        finally:
+            IN_FLIGHT.dec()
+            semaphore.release()
+
     @staticmethod
-    def generate_travel_plan_prompt(request: TravelRequest) -> str:
+    def _trip_values(request: TravelRequest) -> dict:
+        return {
+            "source": request.source,
+            "destination": request.destination,
+            "start_date": request.start_date,
+            "end_date": request.end_date,
+            "budget": request.budget,
+            "travelers": request.travelers,
+            "interests": ", ".join(request.interests),
+        }
+
+    @staticmethod
+    def generate_travel_plan_prompt(request: TravelRequest, compact: Optional[bool] = None) -> str:
         """
         Generate a prompt for the Gemini API based on the travel request.
+        compact asks for short keys (default: PROMPT_COMPACT_SCHEMA).
         """
-        return f"""
-        Create a detailed travel plan with the following information:
-        
-        Source: {request.source}
-        Destination: {request.destination}
-        Dates: {request.start_date} to {request.end_date}
-        Budget: ₹{request.budget}
-        Number of travelers: {request.travelers}
-        Interests: {', '.join(request.interests)}
-        
-        Please provide:
-        1. Day-by-day itinerary
-        2. Accommodation suggestions
-        3. Transportation options
-        4. Cost breakdown
-        5. Activity recommendations based on the interests
-        
-        Format the response as clean structured JSON with the following fields:
-        - itinerary: Array of daily plans with 'day', 'date', 'title' (optional), and 'activities' array
-        - accommodation_suggestions: Array of places to stay with 'name', 'type', 'price_per_night', and 'description'
-        - transportation_options: Array of ways to travel with 'type', 'from', 'to', 'estimated_price', and 'details'
-        - estimated_costs: Object with 'accommodation', 'transportation', 'activities', 'food', 'miscellaneous' (optional), and 'total'
-        - activities: Array of recommended activities with 'name', 'category', and 'description'
-        
-        Use Indian Rupees (₹) for all monetary values.
-        Important: Respond with ONLY the JSON object. Do not include any additional notes, explanations, or markdown formatting outside the JSON.
+        catalog = match_request(request)
+        if catalog is not None:
+            return AIService.generate_catalog_plan_prompt(request, catalog, outline=False, compact=compact)
+
+        return prompt_compiler.PLAN.render(
+            kind="a detailed",
+            known="",
+            fields=prompt_compiler.fields(
+                ("itinerary", {"reference": ""}),
+                ("accommodation_suggestions", {"count": ACCOMMODATION_COUNT}),
+                ("transportation_options", {"count": TRANSPORT_COUNT}),
+                ("activities", {"count": recommended_activities(trip_days(request) or 1)}),
+                compact=compact,
+            ),
+            notes=prompt_compiler.notes(compact=compact),
+            **AIService._trip_values(request),
+        )
+
+    @staticmethod
+    def generate_skeleton_prompt(request: TravelRequest) -> str:
+        """
+        Generate a prompt for the short plan outline used by chunked generation.
+        """
+        catalog = match_request(request)
+        if catalog is not None:
+            return AIService.generate_catalog_plan_prompt(request, catalog, outline=True)
+
+        return prompt_compiler.PLAN.render(
+            kind="an outline of a",
+            known="",
+            fields=prompt_compiler.fields(
+                ("outline", {}),
+                ("accommodation_suggestions", {"count": ACCOMMODATION_COUNT}),
+                ("transportation_options", {"count": TRANSPORT_COUNT}),
+                ("activities", {"count": recommended_activities(trip_days(request) or 1)}),
+            ),
+            notes=prompt_compiler.notes(),
+            **AIService._trip_values(request),
+        )
+
+    @staticmethod
+    def generate_catalog_plan_prompt(
+        request: TravelRequest, catalog: CatalogMatch, outline: bool, compact: Optional[bool] = None
+    ) -> str:
+        """
+        Generate a plan (or outline) prompt for a destination in the catalog. The
+        model schedules known attractions by ID instead of describing them, and
+        accommodation is filled in from the catalog, which keeps the output short.
         """
+        example = catalog.candidates[0].id
+        if outline:
+            itinerary = ("outline", {})
+        else:
+            itinerary = ("itinerary", {
+                "reference": f"; refer to known attractions as their ID in square brackets, e.g. \"[{example}] morning visit\""
+            })
+        return prompt_compiler.PLAN.render(
+            kind="an outline of a" if outline else "a detailed",
+            known=prompt_compiler.block(
+                "Known attractions, best matches for the interests first (ID: name (category)):\n" + catalog.prompt_lines()
+            ),
+            fields=prompt_compiler.fields(
+                itinerary,
+                ("transportation_options", {"count": TRANSPORT_COUNT}),
+                ("catalog_activities", {"count": recommended_activities(trip_days(request) or 1), "example": example}),
+                compact=compact,
+            ),
+            notes=prompt_compiler.notes("Accommodation is chosen separately; do not include it.", compact=compact),
+            **AIService._trip_values(request),
+        )
+
+    @staticmethod
+    def generate_days_prompt(request: TravelRequest, skeleton: dict, days: List[dict]) -> str:
+        """
+        Generate a prompt for the detailed activities of a range of days from the outline.
+        """
+        catalog = match_request(request)
+        known, reference = "", ""
+        if catalog is not None:
+            example = catalog.candidates[0].id
+            known = prompt_compiler.block(
+                f"Known attractions (refer to them as their ID in square brackets, e.g. \"[{example}]\"):\n" + catalog.prompt_lines()
+            )
+            reference = f", attractions as \"[{example}] ...\""
+        return prompt_compiler.DAYS.render(
+            total_days=len(skeleton.get("itinerary", [])),
+            source=request.source,
+            destination=request.destination,
+            travelers=request.travelers,
+            interests=", ".join(request.interests),
+            stays=join(
+                (item.get("name", "") for item in skeleton.get("accommodation_suggestions", []) if isinstance(item, dict)),
+                "not specified",
+            ),
+            known=known,
+            outline="\n".join(f"Day {day['day']} ({day['date']}): {day.get('title') or 'choose a title'}" for day in days),
+            fields=prompt_compiler.fields(("itinerary", {"reference": reference})),
+            notes=prompt_compiler.notes(),
+        )
+
+    @staticmethod
+    def generate_activities_prompt(request: TravelRequest, interests: List[str], existing: List[str]) -> str:
+        """
+        Generate a prompt for activity recommendations covering newly added interests.
+        """
+        count = recommended_activities(len(interests))
+        return prompt_compiler.ACTIVITIES.render(
+            count=count,
+            destination=request.destination,
+            travelers=request.travelers,
+            interests=", ".join(interests),
+            existing=join(existing),
+            fields=prompt_compiler.fields(("activities", {"count": count})),
+            notes=prompt_compiler.notes(),
+        )
+
+    @staticmethod
+    def generate_accommodation_prompt(request: TravelRequest, count: int, exclude: List[str]) -> str:
+        """
+        Generate a prompt for replacement accommodation suggestions.
+        """
+        return prompt_compiler.ACCOMMODATION.render(
+            count=count,
+            destination=request.destination,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            travelers=request.travelers,
+            budget=request.budget,
+            exclude=join(exclude),
+            fields=prompt_compiler.fields(("accommodation_suggestions", {"count": count})),
+            notes=prompt_compiler.notes(),
+        )
 
     @staticmethod
     def clean_ai_response(response_text: str) -> str:
         """
         Clean up the AI response text to handle common formatting issues.
+        Extracts the outermost JSON object in one pass, dropping code fences and
+        surrounding prose, and repairs trailing commas and truncated output.
         """
-        # Remove leading/trailing whitespace
-        cleaned_text = response_text.strip()
-        
-        # Remove markdown code block markers if present
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:]
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3]
+        cleaned_text, _ = extract_json(response_text)
+        return cleaned_text
+
+    @staticmethod
+    def parse_travel_plan(response_text: str, required_fields: List[str] = REQUIRED_FIELDS) -> dict:
+        """
+        Parse the raw model output into a travel plan dict and check its shape.
+        """
+        # Parse the JSON, repairing fences, trailing commas and truncation, and
+        # expand the short keys of a compact response
+        with stage("json_parse"):
+            travel_plan_json, repaired = parse_llm_json(response_text)
+            travel_plan_json = expand_response(travel_plan_json)
+        if repaired:
+            JSON_REPAIRS.inc()
+            logger.warning("repaired_ai_json", extra={"response_chars": len(response_text)})
         
-        # Find the proper JSON content by looking for matching braces
-        match = re.search(r'({[\s\S]*})', cleaned_text)
-        if match:
-            cleaned_text = match.group(1)
+        # Verify that all required fields are present
+        for field in required_fields:
+            if field not in travel_plan_json:
+                raise ValueError(f"Required field '{field}' is missing in the generated travel plan")
         
-        return cleaned_text.strip()
+        return travel_plan_json
+
+    @staticmethod
+    def plan_parser(catalog: Optional[CatalogMatch]) -> Callable[[str], dict]:
+        """
+        The plan parser for a request; accommodation isn't required when it comes from the catalog.
+        """
+        if catalog is None:
+            return AIService.parse_travel_plan
+        return lambda response_text: AIService.parse_travel_plan(response_text, CATALOG_REQUIRED_FIELDS)
+
+    @staticmethod
+    def parse_section(field: str) -> Callable[[str], dict]:
+        """
+        Build a parser for a response holding a single list field, as returned by
+        the days, activities and accommodation prompts.
+        """
+        def parse(response_text: str) -> dict:
+            with stage("json_parse"):
+                section_json, repaired = parse_llm_json(response_text)
+                section_json = expand_response(section_json)
+            if repaired:
+                JSON_REPAIRS.inc()
+            if not isinstance(section_json.get(field), list):
+                raise ValueError(f"Required field '{field}' is missing in the generated response")
+            return section_json
+        return parse
+
+    @staticmethod
+    def parse_days(response_text: str) -> dict:
+        """
+        Parse the response to a days prompt used by chunked generation.
+        """
+        return AIService.parse_section("itinerary")(response_text)
+
+    @staticmethod
+    def validate_plan(travel_plan: dict) -> TravelPlan:
+        """
+        Validate a finished plan into the typed model. This is the only validation
+        pass; routes serialize the returned model without checking it again.
+        """
+        with stage("validation"):
+            try:
+                return TravelPlan.parse_obj(travel_plan)
+            except ValidationError as e:
+                error = e
+
+            # A truncated response repaired into JSON can end in a partial entry.
+            # Drop failing accommodation, transport and activity entries and try
+            # once more; anything else wrong with the plan is an error.
+            entries = [item["loc"][:2] for item in error.errors()]
+            if all(len(loc) == 2 and loc[0] in DROPPABLE_SECTIONS and isinstance(loc[1], int) for loc in entries):
+                invalid = set(entries)
+                for section in DROPPABLE_SECTIONS:
+                    travel_plan[section] = [
+                        entry for index, entry in enumerate(travel_plan.get(section) or [])
+                        if (section, index) not in invalid
+                    ]
+                logger.warning("travel_plan_entries_dropped", extra={"entries": [f"{s}[{i}]" for s, i in sorted(invalid)]})
+                try:
+                    return TravelPlan.parse_obj(travel_plan)
+                except ValidationError as e:
+                    error = e
+
+        ERRORS.inc(type="ValidationError")
+        logger.error("travel_plan_invalid", extra={"error": str(error)})
+        raise HTTPException(status_code=500, detail=f"The generated travel plan is invalid: {str(error)}")
 
     @staticmethod
-    async def generate_travel_plan(request: TravelRequest) -> dict:
+    def checked_for_cache(travel_plan: dict, request: TravelRequest) -> dict:
+        """
+        Validate a freshly generated plan, costed for its request, and return it
+        without the costs (they are recomputed per request) ready to cache. Raises
+        like validate_plan, so a plan that doesn't validate is never cached.
+        """
+        with stage("cost_breakdown"):
+            costed_plan = apply_cost_breakdown(copy.deepcopy(travel_plan), request)
+        AIService.validate_plan(costed_plan)
+        costed_plan.pop("estimated_costs")
+        return costed_plan
+
+    @staticmethod
+    async def generate_travel_plan(request: TravelRequest) -> TravelPlan:
         """
         Generate a travel plan using the Gemini AI model based on the travel request.
         """
-        try:
-            # Construct the prompt
-            prompt = AIService.generate_travel_plan_prompt(request)
-            
-            # Configure the model - using gemini-1.5-flash as specified
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            # Generate content
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                }
+        # Serve identical (normalized) requests from the cache
+        key = cache_key(request)
+        cached_plan = AIService.cache.get(key)
+        if cached_plan is not None:
+            travel_plan = restamp_dates(cached_plan, request.start_date)
+        else:
+            # Concurrent identical requests share a single upstream generation
+            travel_plan = await AIService.inflight.do(
+                key, lambda: AIService._generate_uncached(request, key)
             )
+            # Each caller gets its own copy, dated and costed for its own trip
+            travel_plan = restamp_dates(copy.deepcopy(travel_plan), request.start_date)
+
+        with stage("cost_breakdown"):
+            apply_cost_breakdown(travel_plan, request)
+        return AIService.validate_plan(travel_plan)
+
+    @staticmethod
+    async def refresh_plan(request: TravelRequest) -> None:
+        """
+        Generate the request's plan afresh and replace its cache entry, joining
+        a generation already in flight for the same key. Used by cache warming.
+        """
+        key = cache_key(request)
+        await AIService.inflight.do(key, lambda: AIService._generate_uncached(request, key))
+
+    @staticmethod
+    async def _generate_uncached(request: TravelRequest, key: str) -> dict:
+        """
+        Run one Gemini generation for the request and, once it validates, store
+        it in the cache.
+        """
+        try:
+            catalog = match_request(request)
+            if AIService.use_chunked_generation(request):
+                travel_plan_json = await AIService._generate_chunked(request)
+            else:
+                # Construct the prompt, and an output budget for the trip's length
+                with stage("prompt_build"):
+                    prompt = AIService.generate_travel_plan_prompt(request)
+                    config = AIService.generation_config(
+                        plan_entries(trip_days(request) or 1, catalog is not None, outline=False)
+                    )
+                
+                # Generate, parse and validate the response, with retries
+                travel_plan_json = await AIService.generate_json(prompt, AIService.plan_parser(catalog), config)
             
-            # Get the text response
-            travel_plan_text = response.text
-            
-            # Clean up the response text
-            travel_plan_text = AIService.clean_ai_response(travel_plan_text)
-            
-            # Parse the JSON
-            travel_plan_json = json.loads(travel_plan_text)
-            
-            # Verify that all required fields are present
-            required_fields = [
-                "itinerary", 
-                "accommodation_suggestions", 
-                "transportation_options", 
-                "estimated_costs", 
-                "activities"
-            ]
-            
-            for field in required_fields:
-                if field not in travel_plan_json:
-                    raise ValueError(f"Required field '{field}' is missing in the generated travel plan")
-            
+            # Turn catalog IDs back into full entries
+            if catalog is not None:
+                catalog.expand(travel_plan_json, request)
+
+            travel_plan_json = AIService.checked_for_cache(travel_plan_json, request)
+            AIService.cache.set(key, travel_plan_json)
             return travel_plan_json
             
         except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Original response: {response.text}")
+            ERRORS.inc(type="JSONDecodeError")
+            logger.error("ai_json_decode_error", extra={"error": str(e)})
             raise HTTPException(status_code=500, detail=f"Failed to parse the generated travel plan: {str(e)}")
         
+        except HTTPException:
+            raise
+        
         except Exception as e:
-            print(f"Error generating travel plan: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error generating travel plan: {str(e)}") 
\ No newline at end of file
+            ERRORS.inc(type=type(e).__name__)
+            logger.exception("travel_plan_generation_failed")
+            raise HTTPException(status_code=500, detail=f"Error generating travel plan: {str(e)}")
+
+    @staticmethod
+    def use_chunked_generation(request: TravelRequest) -> bool:
+        """
+        Decide whether the request should use skeleton-then-days generation.
+        """
+        if GENERATION_MODE == "single":
+            return False
+        days = trip_days(request)
+        if days is None or days <= CHUNK_DAYS:
+            return False
+        return GENERATION_MODE == "chunked" or days >= CHUNKED_MIN_DAYS
+
+    @staticmethod
+    async def _generate_chunked(request: TravelRequest) -> dict:
+        """
+        Generate a long trip in two rounds: a short skeleton with day titles,
+        accommodation, transport and costs, then the detailed activities for
+        blocks of CHUNK_DAYS days, requested concurrently. Wall-clock time is the
+        skeleton plus the slowest block rather than the whole itinerary.
+        """
+        catalog = match_request(request)
+        skeleton = await AIService.generate_json(
+            AIService.generate_skeleton_prompt(request),
+            AIService.plan_parser(catalog),
+            AIService.generation_config(plan_entries(trip_days(request), catalog is not None, outline=True)),
+        )
+
+        # Make sure the outline has exactly one correctly dated entry per day
+        start = date.fromisoformat(request.start_date)
+        titles = {
+            day.get("day"): day.get("title")
+            for day in skeleton["itinerary"] if isinstance(day, dict)
+        }
+        outline = [
+            {"day": number, "date": (start + timedelta(days=number - 1)).isoformat(), "title": titles.get(number)}
+            for number in range(1, trip_days(request) + 1)
+        ]
+        skeleton["itinerary"] = outline
+
+        blocks = [outline[i:i + CHUNK_DAYS] for i in range(0, len(outline), CHUNK_DAYS)]
+        day_kind = "catalog_day" if catalog is not None else "day"
+        block_plans = await asyncio.gather(*[
+            AIService.generate_json(
+                AIService.generate_days_prompt(request, skeleton, block),
+                AIService.parse_days,
+                AIService.generation_config({day_kind: len(block)}),
+            )
+            for block in blocks
+        ])
+
+        # Merge the detailed days back over the outline, keyed by day number
+        detailed = {}
+        for block_json in block_plans:
+            for day in block_json["itinerary"]:
+                if isinstance(day, dict) and isinstance(day.get("day"), int):
+                    detailed[day["day"]] = day
+
+        itinerary = []
+        for day in outline:
+            merged = {**day, "activities": []}
+            merged.update(detailed.get(day["day"], {}))
+            merged["date"] = day["date"]
+            itinerary.append(merged)
+
+        skeleton["itinerary"] = itinerary
+        return skeleton
+
+    @staticmethod
+    async def replan_travel_plan(request: TravelRequest, plan: dict, delta: ReplanRequest):
+        """
+        Update a stored plan for a changed request, regenerating only what the
+        change affects: new or reworked itinerary days (in blocks of CHUNK_DAYS),
+        activity recommendations for added interests, and swapped accommodation,
+        all requested concurrently with narrowly scoped prompts. Costs are
+        recomputed locally. Returns the new request and the updated, validated plan,
+        or raises a 400 if the changed request's dates are invalid.
+        """
+        new_request = apply_delta(request, delta)
+        if not (trip_days(new_request) or 0) > 0:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid trip dates '{new_request.start_date}' to '{new_request.end_date}': "
+                       "expected YYYY-MM-DD, with the end date on or after the start date"
+            )
+        plan = copy.deepcopy(plan)
+        plan.pop("plan_id", None)
+
+        scope = prepare_replan(plan, request, new_request, delta)
+        logger.info("replan_scope", extra={
+            "full": scope.full, "days": scope.days,
+            "added_interests": scope.added_interests, "accommodation": scope.accommodation,
+        })
+        if scope.full:
+            return new_request, await AIService.generate_travel_plan(new_request)
+
+        # One scoped generation per affected section, each tagged with where it merges
+        tasks, sections = [], []
+        day_kind = "catalog_day" if match_request(new_request) is not None else "day"
+        day_entries = [day for day in plan["itinerary"] if day["day"] in scope.days]
+        for i in range(0, len(day_entries), CHUNK_DAYS):
+            block = day_entries[i:i + CHUNK_DAYS]
+            prompt = AIService.generate_days_prompt(new_request, plan, block)
+            config = AIService.generation_config({day_kind: len(block)})
+            tasks.append(AIService.generate_json(prompt, AIService.parse_days, config))
+            sections.append("itinerary")
+        if scope.added_interests:
+            existing = [item.get("name", "") for item in plan.get("activities") or [] if isinstance(item, dict)]
+            prompt = AIService.generate_activities_prompt(new_request, scope.added_interests, existing)
+            config = AIService.generation_config({"activity": recommended_activities(len(scope.added_interests))})
+            tasks.append(AIService.generate_json(prompt, AIService.parse_section("activities"), config))
+            sections.append("activities")
+        if scope.accommodation:
+            exclude = delta.replace_accommodation + [
+                item.get("name", "") for item in plan.get("accommodation_suggestions") or [] if isinstance(item, dict)
+            ]
+            prompt = AIService.generate_accommodation_prompt(new_request, scope.accommodation, exclude)
+            config = AIService.generation_config({"accommodation": scope.accommodation})
+            tasks.append(AIService.generate_json(prompt, AIService.parse_section("accommodation_suggestions"), config))
+            sections.append("accommodation_suggestions")
+
+        try:
+            results = await asyncio.gather(*tasks)
+        except HTTPException:
+            raise
+        except Exception as e:
+            ERRORS.inc(type=type(e).__name__)
+            logger.exception("replan_failed")
+            raise HTTPException(status_code=500, detail=f"Error updating travel plan: {str(e)}")
+
+        for section, result in zip(sections, results):
+            if section == "itinerary":
+                merge_days(plan, result["itinerary"], scope.days)
+            elif section == "accommodation_suggestions":
+                plan[section] = (plan.get(section) or []) + result[section][:scope.accommodation]
+            else:
+                plan[section] = (plan.get(section) or []) + result[section]
+
+        catalog = match_request(new_request)
+        if catalog is not None:
+            catalog.expand(plan, new_request)
+
+        with stage("cost_breakdown"):
+            apply_cost_breakdown(plan, new_request)
+        travel_plan = AIService.validate_plan(plan)
+        # Only a plan that validated is cached, and without its per-request costs
+        AIService.cache.set(cache_key(new_request), {k: v for k, v in plan.items() if k != "estimated_costs"})
+        return new_request, travel_plan
+
+    @staticmethod
+    async def stream_travel_plan(request: TravelRequest) -> AsyncIterator[dict]:
+        """
+        Generate a travel plan as a stream of events. Every itinerary day,
+        accommodation, transport option and activity is yielded as soon as the
+        model has finished writing it, followed by a final "done" event.
+        """
+        key = cache_key(request)
+        cached_plan = AIService.cache.get(key)
+        if cached_plan is not None:
+            travel_plan = restamp_dates(cached_plan, request.start_date)
+            apply_cost_breakdown(travel_plan, request)
+            for section in PLAN_SECTIONS:
+                values = travel_plan.get(section)
+                for value in values if isinstance(values, list) else [values]:
+                    yield {"type": "item", "section": section, "data": value}
+            yield {"type": "done", "cached": True}
+            return
+
+        # Streamed sections are recognised by their full names, so streams never
+        # ask for compact keys
+        catalog = match_request(request)
+        prompt = AIService.generate_travel_plan_prompt(request, compact=False)
+        config = AIService.generation_config(
+            plan_entries(trip_days(request) or 1, catalog is not None, outline=False), compact=False
+        )
+        parser = IncrementalPlanParser()
+
+        # Catalog accommodation is known up front; IDs are expanded as items arrive
+        if catalog is not None:
+            for stay in catalog.accommodation(request):
+                yield {"type": "item", "section": "accommodation_suggestions", "data": stay}
+
+        async for chunk in AIService.stream_content(prompt, config):
+            for section, value in parser.feed(chunk):
+                # Costs are computed locally once the plan is complete
+                if section not in REQUIRED_FIELDS:
+                    continue
+                if catalog is not None:
+                    value = catalog.expand_activity(value) if section == "activities" else catalog.expand_text(value)
+                yield {"type": "item", "section": section, "data": value}
+
+        try:
+            travel_plan_json = AIService.plan_parser(catalog)(parser.text)
+        except (json.JSONDecodeError, ValueError) as e:
+            ERRORS.inc(type=type(e).__name__)
+            logger.error("streamed_plan_parse_error", extra={"error": str(e)})
+            raise HTTPException(status_code=500, detail=f"Failed to parse the generated travel plan: {str(e)}")
+
+        if catalog is not None:
+            catalog.expand(travel_plan_json, request)
+        travel_plan_json = AIService.checked_for_cache(travel_plan_json, request)
+        AIService.cache.set(key, travel_plan_json)
+        costed_plan = apply_cost_breakdown(copy.deepcopy(travel_plan_json), request)
+        yield {"type": "item", "section": "estimated_costs", "data": costed_plan["estimated_costs"]}
+        yield {"type": "done", "cached": False}
+
+
+# Expose cache and coalescing counters alongside the stage metrics
+registry.register(Counter(
+    "travel_plan_cache_hits_total", "Plan cache hits", callback=lambda: AIService.cache.hits
+))
+registry.register(Counter(
+    "travel_plan_cache_misses_total", "Plan cache misses", callback=lambda: AIService.cache.misses
+))
+registry.register(Counter(
+    "travel_plan_deduplicated_total", "Requests served by another in-flight generation",
+    callback=lambda: AIService.inflight.deduplicated
+))
+registry.register(Gauge(
+    "travel_plan_admission_queue_length", "Requests waiting for upstream quota",
+    callback=lambda: AIService.admission.waiting
+))
+registry.register(Counter(
+    "travel_plan_admission_rejected_total", "Requests rejected by admission control",
+    callback=lambda: AIService.admission.rejected
+))
+registry.register(Gauge(
+    "travel_plan_circuit_open", "1 while the upstream circuit breaker is open",
+    callback=lambda: 0 if AIService.breaker.state == "closed" else 1, multiprocess="max"
+))
+registry.register(Gauge(
+    "travel_plan_generations_in_flight", "Distinct plan generations in progress",
+    callback=AIService.inflight.in_flight
+))
@@ -0,0 +1,293 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from ..models import TravelRequest
+from .admission import SharedTokenBucket, TokenBucket, open_bucket_store
+from .ai_service import ADMISSION_STATE_PATH, ESTIMATED_OUTPUT_TOKENS, AIService
+from .catalog import match_request
+from .metrics import Counter, Gauge, registry, track_tokens
+from .plan_cache import SEASONS, cache_key, normalize_request, trip_days
+from .prompt_compiler import output_budget, plan_entries
+
+logger = logging.getLogger(__name__)
+
+# Background cache warming; off by default since it spends upstream quota
+CACHE_WARMING = os.getenv("CACHE_WARMING", "off").lower() == "on"
+
+# Request profiles (route, trip length, travelers, budget band, interests) kept
+# warm, profiles tracked, and the half-life in hours of their request counts
+WARM_TOP_K = int(os.getenv("WARM_TOP_K", "30"))
+WARM_TRACKED_PROFILES = int(os.getenv("WARM_TRACKED_PROFILES", "1000"))
+WARM_HALF_LIFE_HOURS = float(os.getenv("WARM_HALF_LIFE_HOURS", "72"))
+# Decayed requests a profile needs before it is worth warming
+WARM_MIN_SCORE = float(os.getenv("WARM_MIN_SCORE", "3"))
+
+# Trips starting within this many days are warmed, and entries expiring within
+# WARM_REFRESH_WITHIN seconds are regenerated
+WARM_DAYS_AHEAD = int(os.getenv("WARM_DAYS_AHEAD", "21"))
+WARM_REFRESH_WITHIN = float(os.getenv("WARM_REFRESH_WITHIN", "21600"))
+
+# Off-peak hours (server local time, "start-end", may wrap past midnight), the
+# seconds between warming cycles, and upstream tokens warming may spend per hour
+WARM_HOURS = os.getenv("WARM_HOURS", "1-6")
+WARM_INTERVAL = float(os.getenv("WARM_INTERVAL", "600"))
+WARM_TOKENS_PER_HOUR = float(os.getenv("WARM_TOKENS_PER_HOUR", "200000"))
+
+
+class DecayedTopK:
+    """
+    Approximate top-K of keys by exponentially decayed frequency.
+
+    Uses forward decay: a hit at time t adds 2^((t - t0) / half_life), so stored
+    scores never need updating, and dividing by the same factor for `now` gives
+    the decayed count. At most `capacity` keys are tracked; past that the lowest
+    scoring are dropped in one pass, down to 90% of capacity. Each key keeps the
+    value of its latest hit.
+    """
+
+    def __init__(self, capacity: int, half_life: float, clock: Callable[[], float] = time.time):
+        self.capacity = max(capacity, 1)
+        self.half_life = half_life
+        self.clock = clock
+        self._origin = clock()
+        self._entries: Dict[str, List[Any]] = {}
+
+    def _weight(self, now: float) -> float:
+        return 2.0 ** ((now - self._origin) / self.half_life)
+
+    def add(self, key: str, value: Any) -> None:
+        now = self.clock()
+        weight = self._weight(now)
+        if weight > 2.0 ** 64:
+            # Rescale before the weights grow out of float range
+            for entry in self._entries.values():
+                entry[0] /= weight
+            self._origin, weight = now, 1.0
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [weight, value]
+            if len(self._entries) > self.capacity:
+                keep = sorted(self._entries.items(), key=lambda item: item[1][0], reverse=True)
+                self._entries = dict(keep[:math.ceil(self.capacity * 0.9)])
+        else:
+            entry[0] += weight
+            entry[1] = value
+
+    def top(self, k: int) -> List[Tuple[str, float, Any]]:
+        """
+        The k keys with the highest decayed counts, as (key, count, value).
+        """
+        weight = self._weight(self.clock())
+        best = sorted(self._entries.items(), key=lambda item: item[1][0], reverse=True)[:k]
+        return [(key, score / weight, value) for key, (score, value) in best]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def profile_key(request: TravelRequest) -> Optional[str]:
+    """
+    The cache-relevant part of a request except its season, or None for
+    unparseable dates. Requests with the same profile differ only in dates.
+    """
+    normalized = normalize_request(request)
+    if normalized.pop("season", None) is None:
+        return None
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+
+
+def upcoming_requests(request: TravelRequest, days_ahead: int, today: Optional[date] = None) -> List[TravelRequest]:
+    """
+    One request per season starting in the next `days_ahead` days, dated to its
+    first day there; their plans cover every trip in the window (dates are
+    restamped on a cache hit).
+    """
+    today = today or date.today()
+    length = trip_days(request) or 1
+    requests, seasons = [], set()
+    for offset in range(1, days_ahead + 1):
+        start = today + timedelta(days=offset)
+        if SEASONS[start.month] in seasons:
+            continue
+        seasons.add(SEASONS[start.month])
+        requests.append(request.copy(update={
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=length - 1)).isoformat(),
+        }))
+    return requests
+
+
+def in_hours(hours: str, hour: int) -> bool:
+    start, end = (int(value) for value in hours.split("-"))
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def estimated_tokens(request: TravelRequest) -> int:
+    """
+    Upstream tokens a generation is charged up front; corrected once usage is known.
+    """
+    entries = plan_entries(trip_days(request) or 1, match_request(request) is not None, outline=False)
+    prompt = AIService.generate_travel_plan_prompt(request)
+    return len(prompt) // 4 + (output_budget(entries) or ESTIMATED_OUTPUT_TOKENS)
+
+
+class CacheWarmer:
+    """
+    Keeps the plan cache warm for popular requests.
+
+    Interactive plan requests are counted per profile in a decayed top-K. During
+    the off-peak WARM_HOURS, every WARM_INTERVAL seconds, the hottest profiles are
+    generated for the seasons of the next WARM_DAYS_AHEAD days unless the cache
+    already holds a plan that stays fresh for WARM_REFRESH_WITHIN seconds, so
+    peak-hour requests for them are cache hits. Generations run one at a time
+    through AIService's admission control, draw on an hourly token budget
+    (shared by worker processes with ADMISSION_STATE_PATH), and a cycle stops
+    early once interactive requests queue for quota.
+    """
+
+    def __init__(self, enabled: bool = CACHE_WARMING):
+        self.enabled = enabled
+        self.profiles = DecayedTopK(WARM_TRACKED_PROFILES, WARM_HALF_LIFE_HOURS * 3600)
+        self.warmed = 0
+        self.failed = 0
+        self.last_cycle: Optional[float] = None
+        self._budget = None
+        self._runner: Optional[asyncio.Task] = None
+
+    def record(self, request: TravelRequest) -> None:
+        """
+        Count an interactive request towards its profile's popularity.
+        """
+        if not self.enabled:
+            return
+        key = profile_key(request)
+        if key is not None:
+            self.profiles.add(key, request)
+
+    def _get_budget(self):
+        if self._budget is None and WARM_TOKENS_PER_HOUR > 0:
+            if ADMISSION_STATE_PATH:
+                db = open_bucket_store(ADMISSION_STATE_PATH)
+                self._budget = SharedTokenBucket(db, "warming", WARM_TOKENS_PER_HOUR / 60, WARM_TOKENS_PER_HOUR)
+            else:
+                self._budget = TokenBucket(WARM_TOKENS_PER_HOUR / 60, WARM_TOKENS_PER_HOUR)
+        return self._budget
+
+    @staticmethod
+    async def _charge(budget, call: Callable[..., Any], *args) -> Any:
+        # The shared budget does SQLite I/O; keep it off the event loop
+        if isinstance(budget, SharedTokenBucket):
+            return await asyncio.to_thread(call, *args)
+        return call(*args)
+
+    def start(self) -> None:
+        if self.enabled and self._runner is None:
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    async def _run(self) -> None:
+        # Jitter the schedule so worker processes don't all wake together
+        await asyncio.sleep(random.uniform(0, WARM_INTERVAL))
+        while True:
+            try:
+                if in_hours(WARM_HOURS, datetime.now().hour):
+                    await self.warm_once()
+            except Exception:
+                logger.exception("cache_warming_failed")
+            await asyncio.sleep(WARM_INTERVAL)
+
+    def _due(self, request: TravelRequest) -> bool:
+        expires_at = AIService.cache.expires_at(cache_key(request))
+        return expires_at is None or expires_at - time.time() < WARM_REFRESH_WITHIN
+
+    async def warm_once(self) -> int:
+        """
+        Run one warming cycle now, whatever the hour; returns the plans generated.
+        """
+        budget = await asyncio.to_thread(self._get_budget)
+        if budget is None:
+            return 0
+
+        warmed, stopped = 0, None
+        for _, score, request in self.profiles.top(WARM_TOP_K):
+            if score < WARM_MIN_SCORE or stopped:
+                break
+            for warm_request in upcoming_requests(request, WARM_DAYS_AHEAD):
+                # Checked just before generating, as another worker may have warmed it
+                if not self._due(warm_request):
+                    continue
+                if AIService.admission.waiting:
+                    stopped = "interactive_traffic"
+                    break
+                estimate = estimated_tokens(warm_request)
+                if await self._charge(budget, budget.try_take, estimate):
+                    stopped = "budget_exhausted"
+                    break
+
+                tokens = track_tokens()
+                try:
+                    await AIService.refresh_plan(warm_request)
+                    warmed += 1
+                except HTTPException as e:
+                    self.failed += 1
+                    logger.warning("cache_warming_generation_failed", extra={
+                        "status_code": e.status_code, "detail": e.detail,
+                        "route": f"{warm_request.source} -> {warm_request.destination}",
+                    })
+                    if e.status_code in (429, 503):
+                        stopped = "upstream_busy"
+                        break
+                finally:
+                    used = tokens["prompt"] + tokens["output"]
+                    if not tokens["calls"]:
+                        # Joined a generation in flight, or failed before reaching the upstream
+                        await self._charge(budget, budget.adjust, -estimate)
+                    elif tokens["reported"] == tokens["calls"] or used > estimate:
+                        # Charge what the generation really used; calls that reported
+                        # no usage (e.g. timed out) keep at least the estimate charged
+                        await self._charge(budget, budget.adjust, used - estimate)
+
+        self.warmed += warmed
+        self.last_cycle = time.time()
+        logger.info("cache_warming_cycle", extra={"warmed": warmed, "stopped": stopped, "tracked": len(self.profiles)})
+        return warmed
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "tracked_profiles": len(self.profiles),
+            "warmed": self.warmed,
+            "failed": self.failed,
+            "last_cycle": self.last_cycle,
+            "hottest": [
+                {"route": f"{request.source} -> {request.destination}", "days": trip_days(request), "score": round(score, 2)}
+                for _, score, request in self.profiles.top(10)
+            ],
+        }
+
+
+cache_warmer = CacheWarmer()
+
+registry.register(Counter(
+    "travel_plan_cache_warmed_total", "Plans generated ahead of demand by cache warming",
+    callback=lambda: cache_warmer.warmed
+))
+registry.register(Gauge(
+    "travel_plan_cache_warming_profiles", "Request profiles tracked for cache warming",
+    callback=lambda: len(cache_warmer.profiles)
+))
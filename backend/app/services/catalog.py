@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import math
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+from ..models import TravelRequest
+from .cost_engine import TRAVELERS_PER_ROOM, format_amount
+from .plan_cache import trip_days
+
+# Offline destination catalog; set DESTINATION_CATALOG=off to always let the model invent places
+CATALOG_ENABLED = os.getenv("DESTINATION_CATALOG", "on").lower() != "off"
+CATALOG_PATH = os.getenv("DESTINATION_CATALOG_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "destinations.json"
+)
+
+# Candidate attractions passed to the model per plan
+CATALOG_MAX_CANDIDATES = int(os.getenv("CATALOG_MAX_CANDIDATES", "15"))
+
+# Share of the budget assumed for accommodation when picking a hotel tier
+ACCOMMODATION_BUDGET_SHARE = float(os.getenv("ACCOMMODATION_BUDGET_SHARE", "0.4"))
+
+# Interest spellings mapped onto the catalog's tags
+_SYNONYMS = {
+    "beach": "beaches", "sea": "beaches", "coast": "beaches",
+    "party": "nightlife", "parties": "nightlife", "club": "nightlife", "bar": "nightlife",
+    "cuisine": "food", "foodie": "food", "street food": "food", "dining": "food",
+    "temple": "spiritual", "religion": "spiritual", "religious": "spiritual", "yoga": "spiritual",
+    "hike": "trekking", "hiking": "trekking", "trek": "trekking",
+    "museum": "museums", "heritage": "heritage", "historical": "history", "monument": "history",
+    "wildlife": "wildlife", "safari": "wildlife", "animal": "wildlife",
+    "adventure sport": "adventure", "outdoor": "adventure",
+    "market": "shopping", "relax": "relaxation", "spa": "wellness",
+    "scenery": "nature", "mountain": "nature", "hill": "nature",
+}
+
+_ID_REFERENCE = re.compile(r"\[([a-z]{3}-\d{2})\]")
+
+Attraction = namedtuple("Attraction", "id name category tags cost hours description")
+Hotel = namedtuple("Hotel", "tier name type price_per_night description")
+
+
+def normalize_tag(value: str) -> str:
+    tag = " ".join(value.casefold().split())
+    if tag in _SYNONYMS:
+        return _SYNONYMS[tag]
+    singular = tag[:-1] if tag.endswith("s") else tag
+    return _SYNONYMS.get(singular, tag)
+
+
+class Destination:
+    """
+    One catalog city: attractions as tuples plus an inverted index from
+    normalized interest tag to attraction positions.
+    """
+
+    __slots__ = ("id", "name", "attractions", "hotels", "tag_index")
+
+    def __init__(self, data: dict):
+        self.id = data["id"]
+        self.name = data["name"]
+        self.attractions: Tuple[Attraction, ...] = tuple(
+            Attraction(item["id"], item["name"], item["category"], tuple(item.get("tags", ())),
+                       item.get("cost", 0), item.get("hours"), item.get("description", ""))
+            for item in data.get("attractions", [])
+        )
+        self.hotels: Tuple[Hotel, ...] = tuple(
+            Hotel(hotel["tier"], hotel["name"], hotel["type"], hotel["price_per_night"], hotel.get("description", ""))
+            for hotel in data.get("hotels", [])
+        )
+
+        index: Dict[str, List[int]] = {}
+        for position, attraction in enumerate(self.attractions):
+            for tag in {normalize_tag(tag) for tag in attraction.tags + (attraction.category,)}:
+                index.setdefault(tag, []).append(position)
+        self.tag_index: Dict[str, Tuple[int, ...]] = {tag: tuple(positions) for tag, positions in index.items()}
+
+
+class Catalog:
+    def __init__(self, destinations: List[dict]):
+        self._destinations: Dict[str, Destination] = {}
+        self._attractions: Dict[str, Attraction] = {}
+        for data in destinations:
+            destination = Destination(data)
+            for name in [data["name"]] + data.get("aliases", []):
+                self._destinations[name.casefold()] = destination
+            for attraction in destination.attractions:
+                self._attractions[attraction.id] = attraction
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["destinations"])
+
+    def find(self, destination: str) -> Optional[Destination]:
+        """
+        Look up a destination by name or alias, ignoring case and anything after a comma.
+        """
+        name = " ".join(destination.split(",")[0].casefold().split())
+        return self._destinations.get(name)
+
+    def attraction(self, attraction_id: str) -> Optional[Attraction]:
+        return self._attractions.get(attraction_id)
+
+    @staticmethod
+    def rank(destination: Destination, interests: List[str], limit: int) -> List[Attraction]:
+        """
+        Rank a destination's attractions for the given interests, earlier
+        interests weighing more. Unmatched attractions follow in catalog order
+        (most popular first) to fill the list.
+        """
+        scores: Dict[int, float] = {}
+        for rank, interest in enumerate(interests):
+            weight = 1.0 / (1 + 0.25 * rank)
+            for position in destination.tag_index.get(normalize_tag(interest), ()):
+                scores[position] = scores.get(position, 0.0) + weight
+
+        order = sorted(range(len(destination.attractions)), key=lambda position: (-scores.get(position, 0.0), position))
+        return [destination.attractions[position] for position in order[:limit]]
+
+
+class CatalogMatch:
+    """
+    The catalog entries chosen for one request, and the expansion of the
+    model's ID references back into full plan entries.
+    """
+
+    def __init__(self, catalog: Catalog, destination: Destination, candidates: List[Attraction]):
+        self.catalog = catalog
+        self.destination = destination
+        self.candidates = candidates
+
+    def prompt_lines(self) -> str:
+        return "\n".join(f"{item.id}: {item.name} ({item.category})" for item in self.candidates)
+
+    def expand_activity(self, value):
+        """
+        An attraction ID (or "[ID]") becomes a full activity entry; anything else is kept.
+        """
+        if not isinstance(value, str):
+            return value
+        attraction = self.catalog.attraction(value.strip().strip("[]"))
+        if attraction is None:
+            return {"name": value, "category": "other", "description": ""}
+        activity = {
+            "id": attraction.id,
+            "name": attraction.name,
+            "category": attraction.category,
+            "description": attraction.description,
+            "estimated_cost": format_amount(attraction.cost) if attraction.cost else "Free",
+        }
+        if attraction.hours:
+            activity["duration"] = f"{attraction.hours:g} hours"
+        return activity
+
+    def expand_text(self, value):
+        """
+        Replace "[ID]" references in itinerary text with attraction names.
+        """
+        if isinstance(value, str):
+            def name(match):
+                attraction = self.catalog.attraction(match.group(1))
+                return attraction.name if attraction else match.group(0)
+            return _ID_REFERENCE.sub(name, value)
+        if isinstance(value, dict):
+            return {key: self.expand_text(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.expand_text(item) for item in value]
+        return value
+
+    def accommodation(self, request: TravelRequest) -> List[dict]:
+        """
+        The destination's hotel tiers, best fit for the budget first: the dearest
+        tier within the nightly room budget, then the rest cheapest first.
+        """
+        nights = max((trip_days(request) or 2) - 1, 1)
+        rooms = math.ceil(max(request.travelers, 1) / TRAVELERS_PER_ROOM)
+        nightly = request.budget * ACCOMMODATION_BUDGET_SHARE / nights / rooms
+
+        affordable = sorted((hotel for hotel in self.destination.hotels if hotel.price_per_night <= nightly),
+                            key=lambda hotel: -hotel.price_per_night)
+        others = sorted((hotel for hotel in self.destination.hotels if hotel.price_per_night > nightly),
+                        key=lambda hotel: hotel.price_per_night)
+        return [
+            {
+                "name": hotel.name,
+                "type": hotel.type,
+                "price_per_night": format_amount(hotel.price_per_night),
+                "description": hotel.description,
+            }
+            for hotel in affordable[:1] + others + affordable[1:]
+        ]
+
+    def expand(self, plan: dict, request: TravelRequest) -> dict:
+        """
+        Expand a plan written against the catalog in place: activity IDs become
+        entries, [ID] references become names, and accommodation comes from the
+        catalog's hotel tiers unless the model wrote its own.
+        """
+        if isinstance(plan.get("activities"), list):
+            plan["activities"] = [self.expand_activity(item) for item in plan["activities"]]
+        if isinstance(plan.get("itinerary"), list):
+            plan["itinerary"] = self.expand_text(plan["itinerary"])
+        if not plan.get("accommodation_suggestions"):
+            plan["accommodation_suggestions"] = self.accommodation(request)
+        return plan
+
+
+_catalog: Optional[Catalog] = None
+
+
+def get_catalog() -> Optional[Catalog]:
+    """
+    Load the catalog on first use; None if it is disabled or missing.
+    """
+    global _catalog
+    if _catalog is None and CATALOG_ENABLED and os.path.exists(CATALOG_PATH):
+        _catalog = Catalog.load(CATALOG_PATH)
+    return _catalog
+
+
+def match_request(request: TravelRequest) -> Optional[CatalogMatch]:
+    """
+    The ranked catalog candidates for the request's destination and interests,
+    or None when the destination isn't in the catalog.
+    """
+    catalog = get_catalog()
+    if catalog is None:
+        return None
+    destination = catalog.find(request.destination)
+    if destination is None or not destination.attractions:
+        return None
+    return CatalogMatch(catalog, destination, Catalog.rank(destination, request.interests, CATALOG_MAX_CANDIDATES))
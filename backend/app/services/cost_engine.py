@@ -0,0 +1,150 @@
+import os
+import re
+import math
+from typing import Any, Dict, List, Optional
+from .plan_cache import trip_days
+
+# Realistic food spend per person per day, in ₹
+FOOD_PER_PERSON_PER_DAY = float(os.getenv("FOOD_PER_PERSON_PER_DAY", "750"))
+
+# Travelers sharing one room
+TRAVELERS_PER_ROOM = int(os.getenv("TRAVELERS_PER_ROOM", "2"))
+
+COST_FIELDS = ["accommodation", "transportation", "activities", "food", "miscellaneous"]
+
+_NUMBER = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(k|lakh|lac)?\b", re.IGNORECASE)
+_RANGE = re.compile(r"\d\s*(?:-|–|to)\s*(?:₹|rs\.?|inr)?\s*\d", re.IGNORECASE)
+_MULTIPLIERS = {"k": 1_000, "lakh": 100_000, "lac": 100_000}
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """
+    Read a rupee amount from a model-written price such as "₹3,500",
+    "₹2,000 - ₹3,000 per night", "1.5k" or "Free". Ranges use their midpoint.
+    Returns None when no amount can be found.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+
+    amounts = []
+    for number, suffix in _NUMBER.findall(value):
+        amount = float(number.replace(",", ""))
+        if suffix:
+            amount *= _MULTIPLIERS[suffix.lower()]
+        amounts.append(amount)
+
+    if not amounts:
+        return 0.0 if "free" in value.lower() else None
+    if len(amounts) >= 2 and _RANGE.search(value):
+        return (amounts[0] + amounts[1]) / 2
+    return amounts[0]
+
+
+def format_amount(amount: float) -> str:
+    return f"₹{amount:,.0f}"
+
+
+def _accommodation_cost(plan: dict, nights: int, travelers: int) -> Optional[float]:
+    # The first priced suggestion is the model's primary recommendation
+    for stay in plan.get("accommodation_suggestions") or []:
+        if isinstance(stay, dict):
+            price = parse_amount(stay.get("price_per_night"))
+            if price is not None:
+                rooms = math.ceil(travelers / TRAVELERS_PER_ROOM)
+                return price * nights * rooms
+    return None
+
+
+def _transportation_cost(plan: dict, travelers: int) -> Optional[float]:
+    # Options on the same route are alternatives, so take the cheapest per route
+    cheapest: Dict[tuple, float] = {}
+    for option in plan.get("transportation_options") or []:
+        if not isinstance(option, dict):
+            continue
+        price = parse_amount(option.get("estimated_price"))
+        if price is None:
+            continue
+        route = (str(option.get("from", "")).casefold(), str(option.get("to", "")).casefold())
+        cheapest[route] = min(price, cheapest.get(route, price))
+
+    if not cheapest:
+        return None
+    return sum(cheapest.values()) * travelers
+
+
+def _activities_cost(plan: dict, travelers: int) -> Optional[float]:
+    priced: List[tuple] = []
+    for activity in plan.get("activities") or []:
+        if isinstance(activity, dict):
+            price = parse_amount(activity.get("estimated_cost"))
+            if price is not None:
+                priced.append((str(activity.get("name", "")).casefold(), price))
+
+    if not priced:
+        return None
+
+    # Count the recommendations that made it into the itinerary, if any did
+    itinerary_text = " ".join(
+        str(item) for day in plan.get("itinerary") or [] if isinstance(day, dict)
+        for item in day.get("activities") or []
+    ).casefold()
+    scheduled = [price for name, price in priced if name and name in itinerary_text]
+    return sum(scheduled or [price for _, price in priced]) * travelers
+
+
+def compute_cost_breakdown(plan: dict, budget: float, travelers: int, days: Optional[int]) -> dict:
+    """
+    Compute the cost breakdown for a plan from its itemised prices.
+
+    Accommodation is the primary suggestion's nightly rate for every night and
+    room, transportation the cheapest option on each route, activities the priced
+    recommendations scheduled in the itinerary, and food a flat daily allowance.
+    Whatever is left of the budget becomes miscellaneous. Lines the plan gives no
+    prices for fall back to the model's own estimate. Each line is returned both
+    formatted (e.g. "₹12,500") and as a number in "<line>_amount".
+    """
+    travelers = max(travelers, 1)
+    # End dates before the start give a negative count; fall back as for unparseable ones
+    days = days if days and days > 0 else len(plan.get("itinerary") or []) or 1
+    nights = max(days - 1, 1)
+    model_costs = plan.get("estimated_costs") if isinstance(plan.get("estimated_costs"), dict) else {}
+
+    computed = {
+        "accommodation": _accommodation_cost(plan, nights, travelers),
+        "transportation": _transportation_cost(plan, travelers),
+        "activities": _activities_cost(plan, travelers),
+        "food": FOOD_PER_PERSON_PER_DAY * travelers * days,
+    }
+    amounts = {
+        field: value if value is not None else (parse_amount(model_costs.get(field)) or 0.0)
+        for field, value in computed.items()
+    }
+
+    subtotal = sum(amounts.values())
+    amounts["miscellaneous"] = max(budget - subtotal, 0.0)
+    total = subtotal + amounts["miscellaneous"]
+
+    breakdown: Dict[str, Any] = {}
+    for field in COST_FIELDS:
+        breakdown[field] = format_amount(amounts[field])
+    breakdown["total"] = format_amount(total)
+    for field in COST_FIELDS:
+        breakdown[f"{field}_amount"] = round(amounts[field], 2)
+    breakdown["total_amount"] = round(total, 2)
+    breakdown["budget_amount"] = round(budget, 2)
+    breakdown["over_budget"] = subtotal > budget
+    return breakdown
+
+
+def apply_cost_breakdown(plan: dict, request) -> dict:
+    """
+    Replace the plan's estimated_costs with a locally computed, budget-reconciled breakdown.
+    """
+    plan["estimated_costs"] = compute_cost_breakdown(
+        plan, request.budget, request.travelers, trip_days(request)
+    )
+    return plan
@@ -0,0 +1,436 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from ..models import TravelRequest
+from .ai_service import AIService
+
+logger = logging.getLogger(__name__)
+
+# Job queue backend: "memory" (lost on restart) or "sqlite" (survives restarts)
+JOB_QUEUE = os.getenv("JOB_QUEUE", "sqlite")
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.db")
+
+# Plans generated at once across all batch jobs, requests allowed per batch,
+# and attempts per plan when the upstream is rate limited or unavailable
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "1000"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "5"))
+
+# Seconds a claimed item stays leased to its worker without a renewal; leases
+# are renewed, and expired ones reclaimed, every third of that
+BATCH_LEASE_SECONDS = float(os.getenv("BATCH_LEASE_SECONDS", "60"))
+
+# A claimed item: (job id, index in the batch, request JSON, attempts including this one)
+Claim = Tuple[str, int, str, int]
+
+
+class JobQueue(ABC):
+    """
+    Storage for batch jobs and their items.
+
+    Items move pending -> running -> done | failed. Finished items get an
+    increasing sequence number so results can be read in completion order.
+    """
+
+    @abstractmethod
+    def create(self, requests: List[TravelRequest]) -> str:
+        """Create a job with one pending item per request and return its id."""
+
+    @abstractmethod
+    def claim(self, limit: int) -> List[Claim]:
+        """Mark up to `limit` pending items, oldest job first, as running and return them."""
+
+    @abstractmethod
+    def finish(self, job_id: str, index: int, plan_id: Optional[str] = None,
+               error: Optional[str] = None, status_code: Optional[int] = None) -> None:
+        """Record an item's plan id, or its error."""
+
+    @abstractmethod
+    def release(self, job_id: str, index: int) -> None:
+        """Put a running item back to pending for another attempt."""
+
+    @abstractmethod
+    def renew(self) -> None:
+        """Extend the leases of the items this queue has claimed."""
+
+    @abstractmethod
+    def recover(self) -> int:
+        """Return running items whose lease expired (their worker died) to pending; returns how many."""
+
+    @abstractmethod
+    def summary(self, job_id: str) -> Optional[dict]:
+        """Counts per status for a job, or None if there is no such job."""
+
+    @abstractmethod
+    def results(self, job_id: str, offset: int = 0) -> List[dict]:
+        """Finished items in completion order, skipping the first `offset`."""
+
+
+class MemoryJobQueue(JobQueue):
+    """
+    In-process job queue. Fast and dependency free, but jobs die with the process.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+        self._pending: deque = deque()
+        self._seq = 0
+
+    def create(self, requests: List[TravelRequest]) -> str:
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "created_at": time.time(),
+            "items": [
+                {"index": index, "request": request.json(), "status": "pending", "attempts": 0}
+                for index, request in enumerate(requests)
+            ],
+        }
+        self._pending.extend((job_id, index) for index in range(len(requests)))
+        return job_id
+
+    def claim(self, limit: int) -> List[Claim]:
+        claimed = []
+        while self._pending and len(claimed) < limit:
+            job_id, index = self._pending.popleft()
+            item = self._jobs[job_id]["items"][index]
+            item["status"] = "running"
+            item["attempts"] += 1
+            claimed.append((job_id, index, item["request"], item["attempts"]))
+        return claimed
+
+    def finish(self, job_id, index, plan_id=None, error=None, status_code=None) -> None:
+        self._seq += 1
+        self._jobs[job_id]["items"][index].update({
+            "status": "failed" if error else "done",
+            "plan_id": plan_id, "error": error, "status_code": status_code, "seq": self._seq,
+        })
+
+    def release(self, job_id: str, index: int) -> None:
+        self._jobs[job_id]["items"][index]["status"] = "pending"
+        self._pending.append((job_id, index))
+
+    def renew(self) -> None:
+        pass
+
+    def recover(self) -> int:
+        return 0
+
+    def summary(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        for item in job["items"]:
+            counts[item["status"]] += 1
+        return _summary(job_id, job["created_at"], len(job["items"]), counts)
+
+    def results(self, job_id: str, offset: int = 0) -> List[dict]:
+        finished = sorted(
+            (item for item in self._jobs[job_id]["items"] if item["status"] in ("done", "failed")),
+            key=lambda item: item["seq"],
+        )
+        return [_result(item) for item in finished[offset:]]
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job queue in a SQLite file (WAL mode), so batches survive a restart and can
+    be shared by several worker processes. Claims run in an immediate
+    transaction so two workers never take the same item.
+
+    Claimed items are leased to a random owner token made per queue instance,
+    so a restarted process (even one with the same pid) never mistakes the
+    items of its predecessor for its own. Leases last `lease` seconds unless
+    renewed; items whose lease ran out are reclaimed by any worker.
+    """
+
+    def __init__(self, path: str, lease: float = BATCH_LEASE_SECONDS):
+        self.path = path
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, created_at REAL NOT NULL, total INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                "job_id TEXT NOT NULL, idx INTEGER NOT NULL, request TEXT NOT NULL, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, plan_id TEXT, "
+                "error TEXT, status_code INTEGER, seq INTEGER, owner TEXT, lease_until REAL, "
+                "PRIMARY KEY (job_id, idx))"
+            )
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(job_items)")}
+            if "lease_until" not in columns:
+                self._db.execute("ALTER TABLE job_items ADD COLUMN lease_until REAL")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_job_items_seq ON job_items (job_id, seq)")
+        return self._db
+
+    def create(self, requests: List[TravelRequest]) -> str:
+        job_id = uuid.uuid4().hex
+        db = self._connect()
+        with db:
+            db.execute("BEGIN")
+            db.execute("INSERT INTO jobs (id, created_at, total) VALUES (?, ?, ?)", (job_id, time.time(), len(requests)))
+            db.executemany(
+                "INSERT INTO job_items (job_id, idx, request, status) VALUES (?, ?, ?, 'pending')",
+                [(job_id, index, request.json()) for index, request in enumerate(requests)],
+            )
+        return job_id
+
+    def claim(self, limit: int) -> List[Claim]:
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT job_id, idx, request, attempts FROM job_items WHERE status = 'pending' ORDER BY rowid LIMIT ?",
+                (limit,),
+            ).fetchall()
+            lease_until = time.time() + self.lease
+            db.executemany(
+                "UPDATE job_items SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ? "
+                "WHERE job_id = ? AND idx = ?",
+                [(self.owner, lease_until, row["job_id"], row["idx"]) for row in rows],
+            )
+        return [(row["job_id"], row["idx"], row["request"], row["attempts"] + 1) for row in rows]
+
+    def finish(self, job_id, index, plan_id=None, error=None, status_code=None) -> None:
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE job_items SET status = ?, plan_id = ?, error = ?, status_code = ?, owner = NULL, "
+                "lease_until = NULL, seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM job_items WHERE job_id = ?) "
+                "WHERE job_id = ? AND idx = ? AND status = 'running'",
+                ("failed" if error else "done", plan_id, error, status_code, job_id, job_id, index),
+            )
+
+    def release(self, job_id: str, index: int) -> None:
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE job_items SET status = 'pending', owner = NULL, lease_until = NULL "
+                "WHERE job_id = ? AND idx = ? AND status = 'running' AND owner = ?",
+                (job_id, index, self.owner),
+            )
+
+    def renew(self) -> None:
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE job_items SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (time.time() + self.lease, self.owner),
+            )
+
+    def recover(self) -> int:
+        """
+        Only expired leases are taken back, so a worker starting next to live
+        ones leaves their work alone. Items claimed before leases existed have
+        none and are taken back too.
+        """
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            return db.execute(
+                "UPDATE job_items SET status = 'pending', owner = NULL, lease_until = NULL "
+                "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+                (time.time(),),
+            ).rowcount
+
+    def summary(self, job_id: str) -> Optional[dict]:
+        db = self._connect()
+        job = db.execute("SELECT created_at, total FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        for row in db.execute("SELECT status, COUNT(*) AS n FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)):
+            counts[row["status"]] = row["n"]
+        return _summary(job_id, job["created_at"], job["total"], counts)
+
+    def results(self, job_id: str, offset: int = 0) -> List[dict]:
+        rows = self._connect().execute(
+            "SELECT idx AS 'index', request, status, plan_id, error, status_code FROM job_items "
+            "WHERE job_id = ? AND seq IS NOT NULL ORDER BY seq LIMIT -1 OFFSET ?",
+            (job_id, offset),
+        ).fetchall()
+        return [_result(dict(row)) for row in rows]
+
+
+def _summary(job_id: str, created_at: float, total: int, counts: dict) -> dict:
+    finished = counts["done"] + counts["failed"]
+    if finished == total:
+        status = "completed"
+    elif finished or counts["running"]:
+        status = "running"
+    else:
+        status = "queued"
+    return {
+        "job_id": job_id,
+        "status": status,
+        "total": total,
+        "succeeded": counts["done"],
+        "failed": counts["failed"],
+        "pending": counts["pending"] + counts["running"],
+        "created_at": created_at,
+    }
+
+
+def _result(item: dict) -> dict:
+    request = json.loads(item["request"])
+    result = {
+        "index": item["index"],
+        "status": item["status"],
+        "route": {field: request[field] for field in ("source", "destination", "start_date", "end_date")},
+    }
+    if item["status"] == "done":
+        result["plan_id"] = item["plan_id"]
+    else:
+        result["error"] = {"status_code": item["status_code"], "detail": item["error"]}
+    return result
+
+
+def create_job_queue() -> JobQueue:
+    if JOB_QUEUE == "memory":
+        return MemoryJobQueue()
+    if JOB_QUEUE == "sqlite":
+        return SQLiteJobQueue(JOB_QUEUE_PATH)
+    raise ValueError(f"Unknown JOB_QUEUE '{JOB_QUEUE}'")
+
+
+class BatchRunner:
+    """
+    Background worker that drains the job queue.
+
+    At most `concurrency` plans are generated at once, across all jobs. Each goes
+    through AIService.generate_travel_plan, so batch items share the plan cache
+    and in-flight deduplication with each other and with interactive traffic, and
+    are stored in the plan store like any other plan. Rate-limit and
+    unavailability errors put the item back in the queue after the suggested
+    delay, up to BATCH_MAX_ATTEMPTS attempts; other errors fail just that item.
+    While running, it renews the leases of its items and reclaims items whose
+    worker died, every third of BATCH_LEASE_SECONDS.
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int):
+        self.queue = queue
+        self.concurrency = concurrency
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._progress: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        if self._runner is None:
+            self._wakeup = asyncio.Event()
+            self._progress = asyncio.Event()
+            self._recover()
+            self._runner = asyncio.ensure_future(self._run())
+            self._heartbeat = asyncio.ensure_future(self._renew_leases())
+
+    async def stop(self) -> None:
+        """
+        Stop claiming work and cancel plans in progress; their items go back to
+        the queue for this or another worker to pick up.
+        """
+        tasks = [task for task in [self._runner, self._heartbeat, *self._tasks] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+        self._heartbeat = None
+
+    def _recover(self) -> None:
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info("batch_items_recovered", extra={"items": recovered})
+            self._wakeup.set()
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(BATCH_LEASE_SECONDS / 3)
+            try:
+                self.queue.renew()
+                self._recover()
+            except sqlite3.Error:
+                logger.exception("batch_lease_renewal_failed")
+
+    def submit(self, requests: List[TravelRequest]) -> str:
+        job_id = self.queue.create(requests)
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    async def wait_for_progress(self, timeout: float) -> None:
+        """
+        Wait until some batch item finishes here, or `timeout` seconds (items may
+        finish in another worker process).
+        """
+        if self._progress is None:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._progress.wait()), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self) -> None:
+        self._progress.set()
+        self._progress = asyncio.Event()
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            free = self.concurrency - len(self._tasks)
+            for claim in self.queue.claim(free) if free > 0 else []:
+                task = asyncio.ensure_future(self._process(*claim))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            await self._wakeup.wait()
+
+    async def _process(self, job_id: str, index: int, request_json: str, attempts: int) -> None:
+        try:
+            request = TravelRequest.parse_raw(request_json)
+            travel_plan = await AIService.generate_travel_plan(request)
+            plan_id, _, _ = await asyncio.to_thread(AIService.store.save, request, travel_plan)
+            self.queue.finish(job_id, index, plan_id=plan_id)
+        except HTTPException as e:
+            if e.status_code in (429, 503) and attempts < BATCH_MAX_ATTEMPTS:
+                # Hold the slot for the suggested delay so the batch backs off
+                await asyncio.sleep(float((e.headers or {}).get("Retry-After", 1)))
+                self.queue.release(job_id, index)
+                return
+            self.queue.finish(job_id, index, error=str(e.detail), status_code=e.status_code)
+        except asyncio.CancelledError:
+            # Stopped mid-plan: hand the item back instead of leaving it running
+            self.queue.release(job_id, index)
+            raise
+        except Exception as e:
+            logger.exception("batch_item_failed", extra={"job_id": job_id, "index": index})
+            self.queue.finish(job_id, index, error=str(e), status_code=500)
+        finally:
+            self._notify()
+
+
+batch_runner = BatchRunner(create_job_queue(), BATCH_CONCURRENCY)
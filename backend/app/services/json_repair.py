@@ -0,0 +1,112 @@
+import json
+import re
+from typing import Any, List, Tuple
+
+# Whole string literals and structural characters; everything else is skipped
+# in C. A lone '"' only matches when a string is cut off by truncation.
+_TOKENS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\],:"]')
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# strict=False tolerates raw newlines and tabs inside strings
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def extract_json(text: str) -> Tuple[str, bool]:
+    """
+    Find the outermost JSON object in an LLM response in a single linear pass.
+
+    The scan is brace- and string-aware, so braces inside string values never
+    confuse it. Prose or code fences before the first '{' and after its matching
+    '}' are dropped. Trailing commas are removed, and a truncated document is cut
+    back to the last complete value and its open arrays/objects are closed.
+
+    Returns the JSON text and whether any repair was needed.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise json.JSONDecodeError("No JSON object found in the response", text, 0)
+
+    stack: List[str] = []
+    expect_key: List[bool] = []
+    dropped_commas: List[int] = []
+    pending_comma = -1
+    end = -1
+    # Last point where the document could be closed cleanly: (offset, depth)
+    safe_end, safe_depth = start, 0
+
+    for match in _TOKENS.finditer(text, start):
+        pos = match.start()
+        char = text[pos]
+
+        if char == '"':
+            if match.end() - pos == 1:
+                # Unterminated string: the response was cut off here
+                break
+            pending_comma = -1
+            if not (stack[-1] == "{" and expect_key[-1]):
+                safe_end, safe_depth = match.end(), len(stack)
+        elif char in "{[":
+            stack.append(char)
+            expect_key.append(char == "{")
+            pending_comma = -1
+            safe_end, safe_depth = pos + 1, len(stack)
+        elif char in "}]":
+            if pending_comma != -1 and not text[pending_comma + 1:pos].strip():
+                dropped_commas.append(pending_comma)
+            pending_comma = -1
+            stack.pop()
+            expect_key.pop()
+            if not stack:
+                end = pos + 1
+                break
+            safe_end, safe_depth = pos + 1, len(stack)
+        elif char == ",":
+            # A comma right after a value marks a clean cut point
+            if pending_comma == -1 or text[pending_comma + 1:pos].strip():
+                safe_end, safe_depth = pos, len(stack)
+            pending_comma = pos
+            if stack[-1] == "{":
+                expect_key[-1] = True
+        elif char == ":":
+            if stack[-1] == "{":
+                expect_key[-1] = False
+
+    truncated = end == -1
+    if truncated:
+        end = safe_end
+
+    # Stitch the document together without the dropped commas
+    pieces = []
+    cursor = start
+    for comma in dropped_commas:
+        if comma >= end:
+            break
+        pieces.append(text[cursor:comma])
+        cursor = comma + 1
+    pieces.append(text[cursor:end])
+
+    if truncated:
+        pieces.append("".join(_CLOSERS[opener] for opener in reversed(stack[:safe_depth])))
+
+    return "".join(pieces), truncated or bool(dropped_commas)
+
+
+def parse_llm_json(text: str) -> Tuple[Any, bool]:
+    """
+    Parse the JSON object in an LLM response, repairing it if needed.
+
+    Well-formed output is decoded straight from the first '{' with raw_decode,
+    which stops at the end of the object and so ignores fences and trailing prose
+    without scanning them. Only when that fails does the response go through
+    extract_json. Returns the parsed object and whether it had to be repaired.
+    """
+    start = text.find("{")
+    if start != -1:
+        try:
+            return _DECODER.raw_decode(text, start)[0], False
+        except json.JSONDecodeError:
+            pass
+
+    json_text, repaired = extract_json(text)
+    return json.loads(json_text, strict=False), repaired
@@ -0,0 +1,114 @@
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Top-level arrays whose elements are emitted one by one
+STREAMED_SECTIONS = {
+    "itinerary",
+    "accommodation_suggestions",
+    "transportation_options",
+    "activities",
+}
+
+# Top-level objects emitted once they are complete
+STREAMED_OBJECTS = {"estimated_costs"}
+
+# strict=False tolerates raw newlines and tabs inside strings, as the final parse does
+_DECODER = json.JSONDecoder(strict=False)
+
+
+class IncrementalPlanParser:
+    """
+    Incrementally parse a travel plan JSON document as it is streamed.
+
+    Feed text chunks in order; each call returns the (section, value) pairs that
+    became complete in that chunk: every element of the top-level plan arrays,
+    plus the estimated_costs object. Elements may be objects, arrays or strings.
+    Only completed elements are decoded, so the scan over the stream stays
+    linear. Anything before the first '{' (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        completed: List[Tuple[str, Any]] = []
+        text = self.text
+
+        for index in range(self._pos, len(text)):
+            char = text[index]
+
+            if self.done:
+                break
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start + 1:index]
+                    elif self._starts_value('"', len(self._stack)):
+                        # A bare string element, e.g. a catalog ID in activities
+                        completed.append((self._key, _DECODER.decode(text[self._string_start:index + 1])))
+                continue
+
+            if not self._stack:
+                if char == "{":
+                    self._stack.append("{")
+                continue
+
+            depth = len(self._stack)
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char == ":" and depth == 1:
+                self._key = self._last_string
+            elif char == "," and depth == 1:
+                self._key = None
+            elif char in "{[":
+                if self._starts_value(char, depth):
+                    self._value_start = index
+                self._stack.append(char)
+            elif char in "}]":
+                self._stack.pop()
+                depth = len(self._stack)
+                if self._value_start is not None and self._ends_value(depth):
+                    try:
+                        completed.append((self._key, _DECODER.decode(text[self._value_start:index + 1])))
+                    except json.JSONDecodeError as e:
+                        # Not streamed; the final full parse repairs or reports it
+                        logger.warning("malformed_streamed_element", extra={"section": self._key, "error": str(e)})
+                    self._value_start = None
+                if not self._stack:
+                    self.done = True
+
+        self._pos = len(text)
+        return completed
+
+    def _starts_value(self, char: str, depth: int) -> bool:
+        # An element of one of the streamed top-level arrays
+        if depth == 2 and self._stack[-1] == "[" and self._key in STREAMED_SECTIONS:
+            return True
+        # A complete top-level object such as estimated_costs
+        return depth == 1 and char == "{" and self._key in STREAMED_OBJECTS
+
+    def _ends_value(self, depth: int) -> bool:
+        if self._key in STREAMED_SECTIONS:
+            return depth == 2
+        return depth == 1
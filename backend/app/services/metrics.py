@@ -0,0 +1,488 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond parsing to slow generations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# Token count buckets, from a short section prompt to a 3-week plan
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+# SQLite file through which worker processes pool their metrics (unset: per process)
+METRICS_STATE_PATH = os.getenv("METRICS_STATE_PATH") or None
+# Seconds between publications of this process's metrics to the shared file
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+# Seconds after which a silent process is considered gone: its counters are
+# folded into a single "retired" series and its gauges stop counting
+METRICS_RETIRE_AFTER = float(os.getenv("METRICS_RETIRE_AFTER", "300"))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+# Sample name suffix (e.g. "_bucket"), labels and value
+Sample = Tuple[str, LabelKey, float]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _render(metric, samples: Iterable[Sample]) -> List[str]:
+    lines = [f"# HELP {metric.name} {metric.documentation}", f"# TYPE {metric.name} {metric.kind}"]
+    for suffix, key, value in samples:
+        lines.append(f"{metric.name}{suffix}{_format_labels(key)} {value}")
+    return lines
+
+
+class Counter:
+    """
+    A monotonically increasing counter, optionally read from a callback at render time.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        if self.callback:
+            return [("", (), self.callback())]
+        return [("", key, value) for key, value in self._values.items()]
+
+    def render(self) -> List[str]:
+        return _render(self, self.samples())
+
+
+class Gauge:
+    """
+    A gauge that is either set directly or read from a callback at render time.
+    `multiprocess` says how the values of several worker processes combine:
+    "sum" or "max".
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Optional[Callable[[], float]] = None,
+        multiprocess: str = "sum",
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.multiprocess = multiprocess
+        self._value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value -= amount
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float:
+        return self.callback() if self.callback else self._value
+
+    def samples(self) -> List[Sample]:
+        return [("", (), self.value())]
+
+    def render(self) -> List[str]:
+        return _render(self, self.samples())
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return sum(series[0]) if series else 0
+
+    def total(self, **labels) -> float:
+        series = self._series.get(_label_key(labels))
+        return series[1][0] if series else 0.0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """
+        Estimate a quantile from the bucket counts (upper bound of its bucket).
+        """
+        series = self._series.get(_label_key(labels))
+        if not series:
+            return None
+        counts = series[0]
+        target = q * sum(counts)
+        running = 0
+        for index, count in enumerate(counts[:-1]):
+            running += count
+            if running >= target:
+                return self.buckets[index]
+        return self.buckets[-1]
+
+    def samples(self) -> List[Sample]:
+        samples: List[Sample] = []
+        for key, (counts, total) in self._series.items():
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                samples.append(("_bucket", key + (("le", repr(bound)),), running))
+            running += counts[-1]
+            samples.append(("_bucket", key + (("le", "+Inf"),), running))
+            samples.append(("_sum", key, total[0]))
+            samples.append(("_count", key, running))
+        return samples
+
+    def render(self) -> List[str]:
+        return _render(self, self.samples())
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self) -> Dict[str, List[Sample]]:
+        """
+        Current samples of every metric, by metric name.
+        """
+        return {metric.name: metric.samples() for metric in self._metrics}
+
+    def metric(self, name: str):
+        return next((metric for metric in self._metrics if metric.name == name), None)
+
+    def render(self, samples: Optional[Dict[str, List[Sample]]] = None) -> str:
+        """
+        Render every metric in the Prometheus text exposition format, from the
+        given samples (e.g. pooled across processes) or this process's own.
+        """
+        lines: List[str] = []
+        for metric in self._metrics:
+            if samples is None:
+                lines.extend(metric.render())
+            else:
+                lines.extend(_render(metric, samples.get(metric.name, [])))
+        return "\n".join(lines) + "\n"
+
+
+SHARED_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS metric_samples ("
+    "process TEXT NOT NULL, metric TEXT NOT NULL, kind TEXT NOT NULL, sample TEXT NOT NULL, "
+    "labels TEXT NOT NULL, value REAL NOT NULL, updated_at REAL NOT NULL, "
+    "PRIMARY KEY (process, metric, sample, labels))"
+)
+
+# Counters and histograms of retired processes, summed into one series
+RETIRE_SQL = (
+    "INSERT INTO metric_samples (process, metric, kind, sample, labels, value, updated_at) "
+    "SELECT 'retired', metric, kind, sample, labels, SUM(value), ? FROM metric_samples "
+    "WHERE process != 'retired' AND kind != 'gauge' AND updated_at < ? "
+    "GROUP BY metric, kind, sample, labels "
+    "ON CONFLICT (process, metric, sample, labels) DO UPDATE SET value = value + excluded.value"
+)
+
+_SUFFIX_ORDER = {"_sum": 1, "_count": 2}
+
+
+def _sample_order(sample: Sample):
+    # Series by series, histogram buckets by bound, then _sum and _count
+    suffix, key, _ = sample
+    bound = dict(key).get("le")
+    base = tuple(pair for pair in key if pair[0] != "le")
+    return base, _SUFFIX_ORDER.get(suffix, 0), float(bound) if bound is not None else 0.0
+
+
+class SharedMetrics:
+    """
+    Metrics pooled across worker processes through a SQLite file.
+
+    Every process publishes its samples under its own id each `interval`
+    seconds. Counters and histograms are summed over all processes that ever
+    published; gauges combine (see Gauge.multiprocess) over the processes heard
+    from in the last three intervals. Counters of a process silent for
+    `retire_after` seconds are folded into a "retired" series, so totals don't
+    drop when a worker restarts. Without a path, metrics stay per process.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        path: Optional[str],
+        interval: float = METRICS_PUBLISH_INTERVAL,
+        retire_after: float = METRICS_RETIRE_AFTER,
+    ):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.retire_after = retire_after
+        self.process = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._runner: Optional[asyncio.Future] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(SHARED_SCHEMA)
+            self._db = db
+        return self._db
+
+    def _rows(self, now: float) -> List[tuple]:
+        # Read on the event loop, where the metrics are updated
+        return [
+            (self.process, metric.name, metric.kind, suffix, json.dumps(key), value, now)
+            for metric in self.registry._metrics
+            for suffix, key, value in metric.samples()
+        ]
+
+    def _write(self, rows: List[tuple], now: float) -> None:
+        cutoff = now - self.retire_after
+        with self._lock, self._connect() as db:
+            db.executemany(
+                "INSERT INTO metric_samples (process, metric, kind, sample, labels, value, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (process, metric, sample, labels) "
+                "DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                rows,
+            )
+            db.execute(RETIRE_SQL, (now, cutoff))
+            db.execute("DELETE FROM metric_samples WHERE process != 'retired' AND updated_at < ?", (cutoff,))
+
+    def _read(self, now: float) -> Dict[str, List[Sample]]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT metric, kind, sample, labels, value, updated_at FROM metric_samples"
+            ).fetchall()
+        modes = {metric.name: getattr(metric, "multiprocess", "sum") for metric in self.registry._metrics}
+        fresh = now - 3 * self.interval
+        pooled: Dict[Tuple[str, str, str], float] = {}
+        for metric, kind, sample, labels, value, updated_at in rows:
+            key = (metric, sample, labels)
+            if kind == "gauge":
+                if updated_at < fresh:
+                    continue
+                if modes.get(metric) == "max" and key in pooled:
+                    pooled[key] = max(pooled[key], value)
+                    continue
+            pooled[key] = pooled.get(key, 0) + value
+        samples: Dict[str, List[Sample]] = {}
+        for (metric, sample, labels), value in pooled.items():
+            key = tuple((name, label) for name, label in json.loads(labels))
+            samples.setdefault(metric, []).append((sample, key, value))
+        for series in samples.values():
+            series.sort(key=_sample_order)
+        return samples
+
+    def _sync(self, rows: List[tuple], now: float) -> Dict[str, List[Sample]]:
+        self._write(rows, now)
+        return self._read(now)
+
+    async def publish(self) -> None:
+        now = time.time()
+        await asyncio.to_thread(self._write, self._rows(now), now)
+
+    async def collect(self) -> Dict[str, List[Sample]]:
+        """
+        Samples pooled across processes, including this process's latest values.
+        Falls back to this process's own samples when the file is unusable.
+        """
+        if not self.enabled:
+            return self.registry.collect()
+        now = time.time()
+        try:
+            return await asyncio.to_thread(self._sync, self._rows(now), now)
+        except sqlite3.Error as e:
+            logger.warning("metrics_pool_unavailable", extra={"error": str(e)})
+            return self.registry.collect()
+
+    async def render(self) -> str:
+        return self.registry.render(await self.collect())
+
+    async def totals(self, *names: str) -> Dict[str, float]:
+        """
+        Pooled values of unlabelled counters or gauges.
+        """
+        samples = await self.collect()
+        return {
+            name: sum(value for suffix, key, value in samples.get(name, []) if not suffix and not key)
+            for name in names
+        }
+
+    def start(self) -> None:
+        if self.enabled and self._runner is None:
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+            try:
+                await self.publish()
+                await asyncio.to_thread(self._drop_gauges)
+            except sqlite3.Error as e:
+                logger.warning("metrics_publish_failed", extra={"error": str(e)})
+
+    def _drop_gauges(self) -> None:
+        # A stopped process no longer has anything in flight
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM metric_samples WHERE process = ? AND kind = 'gauge'", (self.process,))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.publish()
+            except sqlite3.Error as e:
+                logger.warning("metrics_publish_failed", extra={"error": str(e)})
+            await asyncio.sleep(self.interval)
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "travel_plan_stage_seconds",
+    "Time spent in each stage of plan generation",
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "travel_plan_request_seconds",
+    "End-to-end latency of plan requests by outcome",
+))
+UPSTREAM_TOKENS = registry.register(Counter(
+    "travel_plan_upstream_tokens_total",
+    "Upstream tokens, as reported in usage metadata or estimated from text length",
+))
+REQUEST_TOKENS = registry.register(Histogram(
+    "travel_plan_request_tokens",
+    "Prompt and output tokens spent per plan request, by route",
+    buckets=TOKEN_BUCKETS,
+))
+ERRORS = registry.register(Counter(
+    "travel_plan_errors_total",
+    "Plan generation errors by exception type",
+))
+JSON_REPAIRS = registry.register(Counter(
+    "travel_plan_json_repairs_total",
+    "Model responses that needed JSON repair",
+))
+RETRIES = registry.register(Counter(
+    "travel_plan_retries_total",
+    "Upstream attempts retried, by the error that triggered the retry",
+))
+HEDGES = registry.register(Counter(
+    "travel_plan_hedged_requests_total",
+    "Hedged second attempts fired after the hedge delay",
+))
+IN_FLIGHT = registry.register(Gauge(
+    "travel_plan_upstream_in_flight",
+    "Gemini calls currently in progress",
+))
+QUEUE_DEPTH = registry.register(Gauge(
+    "travel_plan_queue_depth",
+    "Requests waiting for a free upstream slot",
+))
+
+# Serves /metrics pooled across worker processes when METRICS_STATE_PATH is set
+shared_metrics = SharedMetrics(registry, METRICS_STATE_PATH)
+
+
+def stage(name: str):
+    """
+    Time a block as one stage of plan generation.
+    """
+    return STAGE_SECONDS.time(stage=name)
+
+
+# Upstream tokens spent on behalf of the current request. The dict is shared
+# with the tasks the request spawns, so parallel day blocks add to one total.
+_request_tokens: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_tokens", default=None)
+
+
+def track_tokens() -> Dict[str, int]:
+    """
+    Start counting upstream tokens for the current request; the returned dict
+    holds its prompt and output totals, whether any of them were estimated, the
+    upstream calls made and how many of those reported usage. Cached and
+    coalesced requests stay at 0.
+    """
+    tokens = {"prompt": 0, "output": 0, "estimated": False, "calls": 0, "reported": 0}
+    _request_tokens.set(tokens)
+    return tokens
+
+
+def add_upstream_call() -> None:
+    tokens = _request_tokens.get()
+    if tokens is not None:
+        tokens["calls"] += 1
+
+
+def add_request_tokens(prompt_tokens: int, output_tokens: int, estimated: bool = False) -> None:
+    tokens = _request_tokens.get()
+    if tokens is not None:
+        tokens["prompt"] += prompt_tokens
+        tokens["output"] += output_tokens
+        tokens["estimated"] = tokens["estimated"] or estimated
+        tokens["reported"] += 1
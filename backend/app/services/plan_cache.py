@@ -0,0 +1,198 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import hashlib
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Optional
+from ..models import TravelRequest
+
+# Travel seasons in India, keyed by month
+SEASONS = {
+    12: "winter", 1: "winter", 2: "winter",
+    3: "summer", 4: "summer", 5: "summer",
+    6: "monsoon", 7: "monsoon", 8: "monsoon", 9: "monsoon",
+    10: "post-monsoon", 11: "post-monsoon",
+}
+
+# Budgets within the same ~10% band share a cache entry
+BUDGET_BUCKET_STEP = float(os.getenv("PLAN_CACHE_BUDGET_STEP", "0.1"))
+
+
+def _normalize_place(value: str) -> str:
+    return " ".join(value.split()).casefold()
+
+
+def budget_bucket(budget: float) -> int:
+    """
+    Map a budget onto a geometric bucket so near-identical budgets share plans.
+    """
+    if budget <= 0:
+        return 0
+    return int(round(math.log(budget) / math.log1p(BUDGET_BUCKET_STEP)))
+
+
+def trip_days(request: TravelRequest) -> Optional[int]:
+    """
+    Number of days in the trip, inclusive of both ends, or None for unparseable dates.
+    """
+    try:
+        start = date.fromisoformat(request.start_date)
+        end = date.fromisoformat(request.end_date)
+    except ValueError:
+        return None
+    return (end - start).days + 1
+
+
+def normalize_request(request: TravelRequest) -> dict:
+    """
+    Reduce a travel request to the fields that actually change the generated plan.
+    """
+    normalized = {
+        "source": _normalize_place(request.source),
+        "destination": _normalize_place(request.destination),
+        "travelers": request.travelers,
+        "budget_bucket": budget_bucket(request.budget),
+        "interests": sorted({_normalize_place(i) for i in request.interests if i.strip()}),
+    }
+
+    days = trip_days(request)
+    if days is not None:
+        normalized["trip_days"] = days
+        normalized["season"] = SEASONS[date.fromisoformat(request.start_date).month]
+    else:
+        # Unparseable dates can't be generalised, so keep them verbatim
+        normalized["dates"] = [request.start_date, request.end_date]
+
+    return normalized
+
+
+def cache_key(request: TravelRequest) -> str:
+    """
+    Stable hash of the normalized request.
+    """
+    payload = json.dumps(normalize_request(request), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def restamp_dates(plan: dict, start_date: str) -> dict:
+    """
+    Rewrite itinerary dates so a cached plan matches the caller's trip dates.
+    """
+    try:
+        start = date.fromisoformat(start_date)
+    except ValueError:
+        return plan
+
+    for index, day in enumerate(plan.get("itinerary", [])):
+        if not isinstance(day, dict):
+            continue
+        offset = day.get("day", index + 1)
+        if not isinstance(offset, int):
+            offset = index + 1
+        day["date"] = (start + timedelta(days=offset - 1)).isoformat()
+
+    return plan
+
+
+class PlanCache:
+    """
+    Two-tier cache of generated travel plans.
+
+    The memory tier is an LRU with a per-entry TTL. The optional disk tier is a
+    SQLite file so cached plans survive restarts and are shared by every worker
+    process on the host. Plans are stored as JSON text, so every hit hands out
+    a fresh copy that callers are free to mutate.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            # WAL lets worker processes sharing the file read while one writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS plan_cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, plan TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, payload = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+            del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT expires_at, plan FROM plan_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                expires_at, payload = row
+                if expires_at > now:
+                    self._remember(key, expires_at, payload)
+                    self.hits += 1
+                    return json.loads(payload)
+                self._db.execute("DELETE FROM plan_cache WHERE key = ?", (key,))
+                self._db.commit()
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, plan: dict) -> None:
+        expires_at = time.time() + self.ttl
+        payload = json.dumps(plan, ensure_ascii=False, separators=(",", ":"))
+        self._remember(key, expires_at, payload)
+
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO plan_cache (key, expires_at, plan) VALUES (?, ?, ?)",
+                (key, expires_at, payload),
+            )
+            self._db.commit()
+
+    def expires_at(self, key: str) -> Optional[float]:
+        """
+        When the live entry for `key` expires, or None if there is none. Not
+        counted as a lookup.
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[0]
+        if self._db is not None:
+            row = self._db.execute("SELECT expires_at FROM plan_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] > now:
+                return row[0]
+        return None
+
+    def _remember(self, key: str, expires_at: float, payload: str) -> None:
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "disk_enabled": self._db is not None,
+        }
@@ -0,0 +1,228 @@
+import os
+import time
+import base64
+import hashlib
+import secrets
+import sqlite3
+import threading
+import orjson
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+from ..models import TravelPlan, TravelRequest
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS plans ("
+    "id TEXT PRIMARY KEY, source TEXT NOT NULL, destination TEXT NOT NULL COLLATE NOCASE, "
+    "start_date TEXT NOT NULL, end_date TEXT NOT NULL, created_at REAL NOT NULL, "
+    "etag TEXT NOT NULL, request TEXT NOT NULL, plan TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_plans_destination ON plans (destination, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_plans_dates ON plans (start_date, end_date)",
+    "CREATE INDEX IF NOT EXISTS idx_plans_created ON plans (created_at, id)",
+]
+
+# Columns added since the first schema, with their type
+ADDED_COLUMNS = {"content_hash": "TEXT"}
+INDEXES_ON_ADDED_COLUMNS = [
+    "CREATE INDEX IF NOT EXISTS idx_plans_content ON plans (content_hash)",
+]
+
+# Seconds between deletions of plans past the retention period
+PRUNE_INTERVAL = 3600
+
+
+def new_plan_id() -> str:
+    """
+    Time-ordered, URL-safe plan id: a millisecond timestamp plus random bits.
+    """
+    return f"{int(time.time() * 1000):011x}{secrets.token_hex(5)}"
+
+
+def _set_fields(model: BaseModel) -> dict:
+    # orjson calls this for each nested model: the fields it was built with, under their aliases
+    fields = model.__fields__
+    return {
+        fields[name].alias if name in fields else name: value
+        for name, value in model.__dict__.items()
+        if name in model.__fields_set__
+    }
+
+
+def serialize_plan(plan: TravelPlan) -> str:
+    """
+    JSON text of a validated plan, equivalent to
+    json.dumps(plan.dict(by_alias=True, exclude_unset=True)) but without building
+    the intermediate dict tree: orjson walks the models directly.
+    """
+    return orjson.dumps(plan, default=_set_fields).decode("utf-8")
+
+
+def make_etag(payload: str) -> str:
+    return '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def content_hash(request_json: str, content: str) -> str:
+    # Identifies a request and plan pair regardless of the plan's id
+    return hashlib.sha256(f"{request_json}\n{content}".encode("utf-8")).hexdigest()
+
+
+def with_plan_id(content: str, plan_id: str) -> str:
+    """
+    The JSON text of a plan serialized without an id, with plan_id added last.
+    """
+    return content[:-1] + ("," if content != "{}" else "") + '"plan_id":' + orjson.dumps(plan_id).decode("utf-8") + "}"
+
+
+def encode_cursor(created_at: float, plan_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}|{plan_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """
+    Read a listing cursor; raises ValueError if it is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, plan_id = raw.split("|", 1)
+        return float(created_at), plan_id
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class PlanStore:
+    """
+    Persistent store of every plan returned to a client, in a SQLite file.
+
+    Plans get a stable, time-ordered id and are stored as the exact JSON that was
+    served, with an ETag, so a revisit is one primary-key lookup (or a 304) and
+    no regeneration. The originating request is kept alongside for re-planning.
+    Serving the same plan for the same request again (e.g. from the plan cache)
+    reuses its row and id instead of adding one, and plans not served for
+    `retention` seconds are deleted (0 keeps them forever).
+    Listings are newest first with keyset pagination over (created_at, id).
+    The file is opened on first use, in WAL mode so readers never block the
+    writer. Writes use their own connection and are safe to run in a thread
+    (save is blocking; async callers run it with asyncio.to_thread).
+    """
+
+    def __init__(self, path: str, retention: float = 0):
+        self.path = path
+        self.retention = retention
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            db.execute(statement)
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(plans)")}
+        for name, kind in ADDED_COLUMNS.items():
+            if name not in columns:
+                db.execute(f"ALTER TABLE plans ADD COLUMN {name} {kind}")
+        for statement in INDEXES_ON_ADDED_COLUMNS:
+            db.execute(statement)
+        db.commit()
+        return db
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self._open()
+        return self._db
+
+    def save(self, request: TravelRequest, plan: TravelPlan) -> Tuple[str, str, str]:
+        """
+        Store a validated plan, setting its plan_id. Returns the id, ETag and stored JSON text.
+        """
+        plan.plan_id = None
+        plan.__fields_set__.discard("plan_id")
+        content = serialize_plan(plan)
+        request_json = request.json()
+        digest = content_hash(request_json, content)
+        now = time.time()
+
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open()
+            db = self._writer
+            row = db.execute("SELECT id, etag, plan FROM plans WHERE content_hash = ?", (digest,)).fetchone()
+            if row is not None:
+                # Served again: keep it as long as if it were new
+                db.execute("UPDATE plans SET created_at = ? WHERE id = ?", (now, row["id"]))
+                plan_id, etag, payload = row["id"], row["etag"], row["plan"]
+            else:
+                plan_id = new_plan_id()
+                payload = with_plan_id(content, plan_id)
+                etag = make_etag(payload)
+                db.execute(
+                    "INSERT INTO plans (id, source, destination, start_date, end_date, created_at, etag, request, plan, content_hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        plan_id, request.source.strip(), request.destination.strip(),
+                        request.start_date, request.end_date, now, etag,
+                        request_json, payload, digest,
+                    ),
+                )
+            if self.retention > 0 and now - self._pruned_at >= PRUNE_INTERVAL:
+                db.execute("DELETE FROM plans WHERE created_at < ?", (now - self.retention,))
+                self._pruned_at = now
+            db.commit()
+
+        plan.plan_id = plan_id
+        return plan_id, etag, payload
+
+    def get(self, plan_id: str) -> Optional[sqlite3.Row]:
+        """
+        Fetch a stored plan row (id, etag, request and plan JSON text, ...), or None.
+        """
+        return self._connect().execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+
+    def etag(self, plan_id: str) -> Optional[str]:
+        row = self._connect().execute("SELECT etag FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        return row["etag"] if row else None
+
+    def list(
+        self,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        destination: Optional[str] = None,
+        start_from: Optional[str] = None,
+        start_to: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        List plan summaries newest first. Returns the page and the cursor for the
+        next page (None on the last page).
+        """
+        clauses, params = [], []
+        if destination:
+            clauses.append("destination = ?")
+            params.append(destination.strip())
+        if start_from:
+            clauses.append("start_date >= ?")
+            params.append(start_from)
+        if start_to:
+            clauses.append("start_date <= ?")
+            params.append(start_to)
+        if cursor:
+            created_at, plan_id = decode_cursor(cursor)
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([created_at, created_at, plan_id])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            "SELECT id, source, destination, start_date, end_date, created_at, etag FROM plans "
+            f"{where} ORDER BY created_at DESC, id DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        return page, next_cursor
@@ -0,0 +1,221 @@
+import os
+import re
+import textwrap
+from string import Formatter
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Ask the model for key-minified JSON, expanded back to the public field names
+# when parsed; saves output tokens on every field of every entry
+COMPACT_SCHEMA = os.getenv("PROMPT_COMPACT_SCHEMA", "off").lower() == "on"
+
+# Cap every generation at max_output_tokens derived from the entries it asks for
+# ("off" leaves generations unbounded), with OUTPUT_TOKEN_MARGIN headroom
+OUTPUT_BUDGET = os.getenv("PROMPT_OUTPUT_BUDGET", "on").lower() != "off"
+OUTPUT_TOKEN_MARGIN = float(os.getenv("OUTPUT_TOKEN_MARGIN", "1.5"))
+MIN_OUTPUT_TOKENS = int(os.getenv("MIN_OUTPUT_TOKENS", "512"))
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", "8192"))
+
+# Entries asked for per section; stating them keeps the output length predictable
+ACCOMMODATION_COUNT = 3
+TRANSPORT_COUNT = 3
+MAX_RECOMMENDED_ACTIVITIES = 12
+
+# Approximate output tokens per entry, as (full keys, compact keys)
+ENTRY_TOKENS = {
+    "day": (260, 190),
+    "catalog_day": (150, 110),
+    "outline_day": (30, 18),
+    "accommodation": (80, 60),
+    "transport": (70, 50),
+    "activity": (80, 60),
+    "activity_id": (8, 8),
+}
+RESPONSE_OVERHEAD_TOKENS = 40
+
+# Public field name -> short key asked for in compact responses
+COMPACT_KEYS = {
+    "itinerary": "i", "day": "d", "date": "dt", "title": "t", "activities": "a",
+    "accommodation_suggestions": "s", "transportation_options": "r",
+    "name": "n", "type": "y", "price_per_night": "p", "description": "ds",
+    "from": "f", "to": "o", "estimated_price": "ep", "details": "dl",
+    "category": "c", "estimated_cost": "ec",
+}
+EXPANDED_KEYS = {short: name for name, short in COMPACT_KEYS.items()}
+
+# Marks a compact prompt; the synthetic provider looks for it too
+COMPACT_NOTE = "Use exactly the short keys shown, minified JSON, and one short sentence per itinerary activity."
+
+_SPACES = re.compile(r"[ \t]+")
+
+
+class PromptTemplate:
+    """
+    A str.format-style prompt template compiled once: dedented, runs of spaces
+    collapsed, lines stripped and blank lines dropped, then turned into a
+    %-format string, which renders in about half the time of str.format.
+
+    Optional blocks ({known}, {notes}) sit at the end of a line and start with
+    a newline when present (see block), so leaving them out leaves no blank line.
+    """
+
+    def __init__(self, template: str):
+        lines = (_SPACES.sub(" ", line).strip() for line in textwrap.dedent(template).splitlines())
+        text = "\n".join(line for line in lines if line)
+        self.text = "".join(
+            literal.replace("%", "%%") + (f"%({field})s" if field else "")
+            for literal, field, _, _ in Formatter().parse(text)
+        )
+
+    def render(self, **values: Any) -> str:
+        return self.text % values
+
+
+def block(text: str) -> str:
+    return "\n" + text if text else ""
+
+
+PLAN = PromptTemplate("""
+    Create {kind} travel plan:
+    Source: {source}
+    Destination: {destination}
+    Dates: {start_date} to {end_date}
+    Budget: ₹{budget}
+    Travelers: {travelers}
+    Interests: {interests}{known}
+    Respond with JSON with these fields:
+    {fields}{notes}
+    Use Indian Rupees (₹) for all monetary values. Respond with ONLY the JSON object, no markdown or notes.
+""")
+
+DAYS = PromptTemplate("""
+    You are detailing part of a {total_days}-day trip from {source} to {destination}
+    for {travelers} traveler(s) interested in {interests}.
+    Suggested accommodation: {stays}{known}
+    Write the detailed plan for these days only, keeping their titles and dates:
+    {outline}
+    Respond with JSON with a single field:
+    {fields}{notes}
+    Use Indian Rupees (₹) for all monetary values. Respond with ONLY the JSON object, no markdown or notes.
+""")
+
+ACTIVITIES = PromptTemplate("""
+    Recommend up to {count} activities in {destination} for {travelers} traveler(s) interested in {interests}.
+    Do not repeat these already planned activities: {existing}
+    Respond with JSON with a single field:
+    {fields}{notes}
+    Use Indian Rupees (₹) for all monetary values. Respond with ONLY the JSON object, no markdown or notes.
+""")
+
+ACCOMMODATION = PromptTemplate("""
+    Suggest {count} place(s) to stay in {destination} from {start_date} to {end_date}
+    for {travelers} traveler(s) with a total trip budget of ₹{budget}.
+    Do not suggest any of these: {exclude}
+    Respond with JSON with a single field:
+    {fields}{notes}
+    Use Indian Rupees (₹) for all monetary values. Respond with ONLY the JSON object, no markdown or notes.
+""")
+
+# Field descriptions per section, as (full keys, compact keys)
+_FIELD_LINES = {
+    "itinerary": (
+        "- itinerary: one entry per day with 'day', 'date', 'title' and 'activities' (array{reference})",
+        "- i (itinerary): one entry per day: {{\"d\": day, \"dt\": date, \"t\": title, \"a\": [activities{reference}]}}",
+    ),
+    "outline": (
+        "- itinerary: one entry per day with only 'day', 'date' and a short 'title' (no activities)",
+        "- i (itinerary): one entry per day, only {{\"d\": day, \"dt\": date, \"t\": short title}}",
+    ),
+    "accommodation_suggestions": (
+        "- accommodation_suggestions: {count} places to stay with 'name', 'type', 'price_per_night' (per room) and 'description'",
+        "- s (accommodation_suggestions): {count} places to stay: {{\"n\": name, \"y\": type, \"p\": price per night per room, \"ds\": description}}",
+    ),
+    "transportation_options": (
+        "- transportation_options: up to {count} ways to travel with 'type', 'from', 'to', 'estimated_price' (per person) and 'details'",
+        "- r (transportation_options): up to {count} ways to travel: {{\"y\": type, \"f\": from, \"o\": to, \"ep\": price per person, \"dl\": details}}",
+    ),
+    "activities": (
+        "- activities: up to {count} recommended activities with 'name', 'category', 'description' and 'estimated_cost' (per person)",
+        "- a (activities): up to {count} recommended activities: {{\"n\": name, \"c\": category, \"ds\": description, \"ec\": cost per person}}",
+    ),
+    "catalog_activities": (
+        "- activities: up to {count} IDs of known attractions you recommend, e.g. [\"{example}\"]; only for a place not listed, an object with 'name', 'category', 'description' and 'estimated_cost' (per person)",
+        "- a (activities): up to {count} IDs of known attractions you recommend, e.g. [\"{example}\"]; only for a place not listed, {{\"n\": name, \"c\": category, \"ds\": description, \"ec\": cost per person}}",
+    ),
+}
+FIELDS = {section: tuple(PromptTemplate(line) for line in lines) for section, lines in _FIELD_LINES.items()}
+
+
+def use_compact(compact: Optional[bool] = None) -> bool:
+    return COMPACT_SCHEMA if compact is None else compact
+
+
+def fields(*sections: Tuple[str, Dict[str, Any]], compact: Optional[bool] = None) -> str:
+    """
+    The field list of a prompt, from (section, format values) pairs.
+    """
+    compact = use_compact(compact)
+    return "\n".join([FIELDS[section][compact].render(**values) for section, values in sections])
+
+
+def notes(*lines: str, compact: Optional[bool] = None) -> str:
+    """
+    Extra instructions as an optional block, plus the compact-keys note if needed.
+    """
+    return block("\n".join(list(lines) + ([COMPACT_NOTE] if use_compact(compact) else [])))
+
+
+def join(values: Iterable[str], empty: str = "none") -> str:
+    return ", ".join(value for value in values if value) or empty
+
+
+def expand_response(response: dict) -> dict:
+    """
+    Expand a compact response to the public field names. Compact responses are
+    recognised by their short top-level keys, so full-key responses (streamed
+    plans, recorded cassettes) are returned untouched.
+    """
+    if isinstance(response, dict) and any(key in EXPANDED_KEYS for key in response):
+        return expand_keys(response)
+    return response
+
+
+def expand_keys(value: Any) -> Any:
+    """
+    Rename the short keys of a compact response back to the public field names,
+    recursively. Other keys are kept, so full-key responses pass through unchanged.
+    """
+    if isinstance(value, dict):
+        return {EXPANDED_KEYS.get(key, key): expand_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand_keys(item) for item in value]
+    return value
+
+
+def recommended_activities(days: int) -> int:
+    return min(max(days * 2, 4), MAX_RECOMMENDED_ACTIVITIES)
+
+
+def plan_entries(days: int, catalog: bool, outline: bool) -> Dict[str, int]:
+    """
+    The entries a whole-plan (or outline) prompt asks for.
+    """
+    entries = {
+        "outline_day" if outline else "catalog_day" if catalog else "day": days,
+        "transport": TRANSPORT_COUNT,
+        "activity_id" if catalog else "activity": recommended_activities(days),
+    }
+    if not catalog:
+        entries["accommodation"] = ACCOMMODATION_COUNT
+    return entries
+
+
+def output_budget(entries: Dict[str, int], compact: Optional[bool] = None) -> Optional[int]:
+    """
+    max_output_tokens for a response holding the given entries per kind, or
+    None when output budgets are off.
+    """
+    if not OUTPUT_BUDGET:
+        return None
+    compact = use_compact(compact)
+    expected = RESPONSE_OVERHEAD_TOKENS + sum(ENTRY_TOKENS[kind][compact] * count for kind, count in entries.items())
+    return int(min(max(expected * OUTPUT_TOKEN_MARGIN, MIN_OUTPUT_TOKENS), MAX_OUTPUT_TOKENS))
@@ -0,0 +1,39 @@
+import os
+from .base import LLMProvider, LLMResponse, Usage
+from .gemini import GeminiProvider
+from .cassette import CassetteMiss, CassetteProvider
+from .synthetic import SyntheticProvider
+
+
+def _synthetic_from_env() -> SyntheticProvider:
+    seed = os.getenv("SYNTHETIC_SEED")
+    return SyntheticProvider(
+        latency_median=float(os.getenv("SYNTHETIC_LATENCY_MEDIAN", "1.0")),
+        latency_sigma=float(os.getenv("SYNTHETIC_LATENCY_SIGMA", "0.5")),
+        activities_per_day=int(os.getenv("SYNTHETIC_ACTIVITIES_PER_DAY", "4")),
+        description_words=int(os.getenv("SYNTHETIC_DESCRIPTION_WORDS", "20")),
+        error_rate=float(os.getenv("SYNTHETIC_ERROR_RATE", "0")),
+        malformed_rate=float(os.getenv("SYNTHETIC_MALFORMED_RATE", "0")),
+        seed=int(seed) if seed else None,
+    )
+
+
+def create_provider(name: str = None) -> LLMProvider:
+    """
+    Build the provider named by LLM_PROVIDER: gemini (default), synthetic,
+    replay (recorded responses from CASSETTE_DIR) or record (call Gemini and
+    save its responses to CASSETTE_DIR).
+    """
+    name = (name or os.getenv("LLM_PROVIDER", "gemini")).lower()
+    cassette_dir = os.getenv("CASSETTE_DIR", "cassettes")
+
+    if name == "gemini":
+        return GeminiProvider()
+    if name == "synthetic":
+        return _synthetic_from_env()
+    if name == "replay":
+        return CassetteProvider(cassette_dir, mode="replay")
+    if name == "record":
+        return CassetteProvider(cassette_dir, mode="record", inner=GeminiProvider())
+    raise ValueError(f"Unknown LLM_PROVIDER '{name}'")
+
@@ -0,0 +1,53 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+
+@dataclass
+class Usage:
+    """
+    Token counts, named like Gemini's usage metadata. `estimated` marks counts
+    derived from text length because the upstream reported none.
+    """
+    prompt_token_count: int = 0
+    candidates_token_count: int = 0
+    estimated: bool = False
+
+
+def estimate_usage(prompt: str, text_length: int) -> Usage:
+    """
+    Usage estimated at about four characters per token.
+    """
+    return Usage(prompt_token_count=len(prompt) // 4, candidates_token_count=text_length // 4, estimated=True)
+
+
+@dataclass
+class LLMResponse:
+    """
+    A complete response, or one chunk of a streamed response.
+    """
+    text: str
+    usage_metadata: Optional[Usage] = None
+
+
+class LLMProvider(ABC):
+    """
+    The interface AIService uses to talk to a language model.
+
+    Providers raise their upstream's own exceptions; AIService classifies them by
+    class name (e.g. ResourceExhausted, ServiceUnavailable) for retries and 429s.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def generate(self, prompt: str, generation_config: dict) -> LLMResponse:
+        """
+        Generate the full response for a prompt.
+        """
+
+    @abstractmethod
+    def stream(self, prompt: str, generation_config: dict) -> AsyncIterator[LLMResponse]:
+        """
+        Stream the response as chunks; usage, if known, is on the last chunk.
+        """
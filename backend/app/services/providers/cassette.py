@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+from typing import AsyncIterator, List, Optional
+from .base import LLMProvider, LLMResponse, Usage
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised in replay mode when no recording exists for a prompt.
+    """
+
+
+def prompt_key(prompt: str, generation_config: dict) -> str:
+    """
+    Hash of the prompt and generation settings that identifies a recording.
+    """
+    payload = json.dumps({"prompt": prompt, "config": generation_config}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CassetteProvider(LLMProvider):
+    """
+    Record real responses to disk, or replay them without a network.
+
+    Each recording is a JSON file named after the hash of the prompt and
+    generation config, holding the response text, its stream chunks and usage.
+    In "record" mode calls go to the wrapped provider and are saved (existing
+    recordings are replayed); in "replay" mode a missing recording raises
+    CassetteMiss.
+    """
+
+    name = "cassette"
+
+    def __init__(self, directory: str, mode: str = "replay", inner: Optional[LLMProvider] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording needs a provider to record from")
+        self.directory = directory
+        self.mode = mode
+        self.inner = inner
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, prompt: str, generation_config: dict) -> Optional[dict]:
+        path = self._path(prompt_key(prompt, generation_config))
+        if not os.path.exists(path):
+            if self.mode == "replay":
+                raise CassetteMiss(f"No recording for prompt {prompt_key(prompt, generation_config)[:12]}")
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, prompt: str, generation_config: dict, chunks: List[str], usage: Optional[Usage]) -> None:
+        recording = {
+            "prompt": prompt,
+            "generation_config": generation_config,
+            "text": "".join(chunks),
+            "chunks": chunks,
+            "usage": vars(usage) if usage else None,
+        }
+        path = self._path(prompt_key(prompt, generation_config))
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(recording, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _usage(recording: dict) -> Optional[Usage]:
+        return Usage(**recording["usage"]) if recording.get("usage") else None
+
+    async def generate(self, prompt: str, generation_config: dict) -> LLMResponse:
+        recording = self._load(prompt, generation_config)
+        if recording is not None:
+            return LLMResponse(text=recording["text"], usage_metadata=self._usage(recording))
+
+        response = await self.inner.generate(prompt, generation_config)
+        self._save(prompt, generation_config, [response.text], response.usage_metadata)
+        return response
+
+    async def stream(self, prompt: str, generation_config: dict) -> AsyncIterator[LLMResponse]:
+        recording = self._load(prompt, generation_config)
+        if recording is not None:
+            chunks = recording.get("chunks") or [recording["text"]]
+            for index, chunk in enumerate(chunks):
+                last = index == len(chunks) - 1
+                yield LLMResponse(text=chunk, usage_metadata=self._usage(recording) if last else None)
+            return
+
+        chunks: List[str] = []
+        usage = None
+        async for chunk in self.inner.stream(prompt, generation_config):
+            chunks.append(chunk.text)
+            usage = chunk.usage_metadata or usage
+            yield chunk
+        self._save(prompt, generation_config, chunks, usage)
@@ -0,0 +1,69 @@
+import os
+from typing import AsyncIterator, Optional
+from .base import LLMProvider, LLMResponse, Usage, estimate_usage
+
+
+def _usage(response) -> Optional[Usage]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return Usage(
+        prompt_token_count=getattr(usage, "prompt_token_count", 0) or 0,
+        candidates_token_count=getattr(usage, "candidates_token_count", 0) or 0,
+    )
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini via the google-generativeai SDK.
+
+    SDK releases whose responses carry no usage_metadata (such as the pinned
+    0.3.x) get usage estimated from the prompt and response length instead, so
+    token metrics and quota accounting still work; it is marked as estimated.
+
+    The SDK is imported and the model client created on first use, then reused,
+    so the app can start (and be imported by workers, tests and tooling) without
+    the SDK's import cost or an API key.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_name: Optional[str] = None, api_key: Optional[str] = None):
+        self.model_name = model_name or os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+        self.api_key = api_key
+        self._model = None
+
+    def get_model(self):
+        if self._model is None:
+            api_key = self.api_key or os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise RuntimeError("Missing GEMINI_API_KEY environment variable")
+
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, prompt: str, generation_config: dict) -> LLMResponse:
+        response = await self.get_model().generate_content_async(
+            prompt,
+            generation_config=generation_config
+        )
+        text = response.text
+        return LLMResponse(text=text, usage_metadata=_usage(response) or estimate_usage(prompt, len(text)))
+
+    async def stream(self, prompt: str, generation_config: dict) -> AsyncIterator[LLMResponse]:
+        response = await self.get_model().generate_content_async(
+            prompt,
+            generation_config=generation_config,
+            stream=True
+        )
+        length, usage = 0, None
+        async for chunk in response:
+            length += len(chunk.text)
+            usage = _usage(chunk)
+            yield LLMResponse(text=chunk.text, usage_metadata=usage)
+        if usage is None:
+            # Usage is expected on the last chunk; end with an empty one carrying the estimate
+            yield LLMResponse(text="", usage_metadata=estimate_usage(prompt, length))
@@ -0,0 +1,213 @@
+import re
+import json
+import math
+import random
+import asyncio
+from datetime import date, timedelta
+from typing import AsyncIterator, List, Optional
+from .base import LLMProvider, LLMResponse, Usage
+from ..prompt_compiler import COMPACT_KEYS, COMPACT_NOTE, EXPANDED_KEYS
+
+_DATES = re.compile(r"Dates:\s*(\d{4}-\d{2}-\d{2})\s+to\s+(\d{4}-\d{2}-\d{2})")
+_DESTINATION = re.compile(r"Destination:\s*(.+)")
+_DAY_LINE = re.compile(r"Day (\d+) \((\d{4}-\d{2}-\d{2})\):\s*(.*)")
+_SINGLE_FIELD = re.compile(r"single field:\s*-\s*(\w+)")
+_ACTIVITY_COUNT = re.compile(r"up to (\d+) (?:recommended activities|IDs)")
+_KNOWN_ID = re.compile(r"^\s*([a-z]{3}-\d{2}): ", re.MULTILINE)
+
+_WORDS = ("scenic", "local", "heritage", "market", "sunset", "walk", "temple", "beach", "museum",
+          "cafe", "river", "fort", "garden", "street", "food", "tour", "evening", "morning")
+
+
+class ServiceUnavailable(Exception):
+    """
+    Injected upstream failure; named like the Google API error so it is retried the same way.
+    """
+
+
+class SyntheticProvider(LLMProvider):
+    """
+    Local fake model that answers travel prompts with well-formed plan JSON.
+
+    Latency is drawn from a lognormal distribution around `latency_median`
+    seconds, and response size from `activities_per_day` and a lognormal number
+    of words per description around `description_words`. `error_rate` injects
+    ServiceUnavailable failures and `malformed_rate` returns fenced, truncated
+    JSON that has to be repaired. Seeded, so runs are reproducible.
+    """
+
+    name = "synthetic"
+
+    def __init__(
+        self,
+        latency_median: float = 1.0,
+        latency_sigma: float = 0.5,
+        activities_per_day: int = 4,
+        description_words: int = 20,
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        chunk_chars: int = 200,
+        seed: Optional[int] = None,
+    ):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.activities_per_day = activities_per_day
+        self.description_words = description_words
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.chunk_chars = max(chunk_chars, 1)
+        self.random = random.Random(seed)
+
+    def _latency(self) -> float:
+        if self.latency_median <= 0:
+            return 0.0
+        return self.random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+
+    def _text(self, median_words: int) -> str:
+        count = max(1, round(self.random.lognormvariate(math.log(max(median_words, 1)), 0.4)))
+        return " ".join(self.random.choice(_WORDS) for _ in range(count)).capitalize()
+
+    def _price(self, low: int, high: int) -> str:
+        return f"₹{self.random.randrange(low, high, 100):,}"
+
+    def _day(self, number: int, day: str, title: Optional[str], detailed: bool, known: List[str], compact: bool) -> dict:
+        entry = {"day": number, "date": day, "title": title or self._text(4)}
+        if detailed and compact:
+            # Compact prompts ask for one short sentence per activity
+            entry["activities"] = [
+                f"[{self.random.choice(known)}] {self._text(4)}" if known else self._text(self.description_words // 2)
+                for _ in range(self.activities_per_day)
+            ]
+        elif detailed:
+            # Catalog prompts get short references to known attractions instead of descriptions
+            entry["activities"] = [
+                {
+                    "time": f"{9 + 2 * index:02d}:00",
+                    "description": f"[{self.random.choice(known)}] {self._text(4)}" if known
+                    else self._text(self.description_words),
+                }
+                for index in range(self.activities_per_day)
+            ]
+        return entry
+
+    def _itinerary(self, prompt: str, detailed: bool) -> List[dict]:
+        known = _KNOWN_ID.findall(prompt)
+        compact = COMPACT_NOTE in prompt
+
+        # Day-block prompts list the days to write; full prompts give the date range
+        lines = _DAY_LINE.findall(prompt)
+        if lines:
+            return [self._day(int(number), day, title, detailed, known, compact) for number, day, title in lines]
+
+        match = _DATES.search(prompt)
+        start, days = date.today(), 3
+        if match:
+            start = date.fromisoformat(match.group(1))
+            days = max((date.fromisoformat(match.group(2)) - start).days + 1, 1)
+        return [
+            self._day(number, (start + timedelta(days=number - 1)).isoformat(), None, detailed, known, compact)
+            for number in range(1, days + 1)
+        ]
+
+    def _plan(self, prompt: str) -> dict:
+        match = _DESTINATION.search(prompt)
+        destination = match.group(1).strip() if match else "the destination"
+
+        if _DAY_LINE.search(prompt):
+            return {"itinerary": self._itinerary(prompt, detailed=True)}
+
+        match = _ACTIVITY_COUNT.search(prompt)
+        activity_count = int(match.group(1)) if match else self.activities_per_day * 2
+
+        plan = {
+            "itinerary": self._itinerary(prompt, detailed="Create an outline" not in prompt),
+            "accommodation_suggestions": [
+                {
+                    "name": f"{destination} {kind}",
+                    "type": kind,
+                    "price_per_night": self._price(1500, 9000),
+                    "description": self._text(self.description_words),
+                }
+                for kind in ("Hotel", "Guesthouse", "Resort")
+            ],
+            "transportation_options": [
+                {
+                    "type": kind,
+                    "from": "Origin",
+                    "to": destination,
+                    "estimated_price": self._price(800, 8000),
+                    "details": self._text(self.description_words // 2),
+                }
+                for kind in ("Flight", "Train", "Bus")
+            ],
+            "activities": [
+                {
+                    "name": self._text(3),
+                    "category": self.random.choice(("culture", "food", "nature", "adventure")),
+                    "description": self._text(self.description_words),
+                    "estimated_cost": self._price(200, 3000),
+                }
+                for _ in range(activity_count)
+            ],
+        }
+
+        # Catalog prompts: recommend known attractions by ID, leave accommodation out
+        known = _KNOWN_ID.findall(prompt)
+        if known:
+            plan["activities"] = self.random.sample(known, min(len(known), activity_count))
+            del plan["accommodation_suggestions"]
+
+        # Single-section prompts (e.g. replacement hotels) get just that section
+        match = _SINGLE_FIELD.search(prompt)
+        field = match and EXPANDED_KEYS.get(match.group(1), match.group(1))
+        if field in plan:
+            return {field: plan[field]}
+        return plan
+
+    def _respond(self, prompt: str, generation_config: dict) -> LLMResponse:
+        if self.random.random() < self.error_rate:
+            raise ServiceUnavailable("Synthetic upstream failure")
+
+        if COMPACT_NOTE in prompt:
+            text = json.dumps(_compact(self._plan(prompt)), ensure_ascii=False, separators=(",", ":"))
+        else:
+            text = json.dumps(self._plan(prompt), ensure_ascii=False, indent=2)
+
+        # Like the real model, stop at max_output_tokens, mid-JSON if need be
+        max_output_tokens = generation_config.get("max_output_tokens")
+        if max_output_tokens and len(text) // 4 > max_output_tokens:
+            text = text[:max_output_tokens * 4]
+
+        if self.random.random() < self.malformed_rate:
+            # Fenced, with prose and a trailing comma, and cut off inside the last list
+            cut = (text.rfind('": [') + len(text)) // 2
+            text = "Here is your plan:\n```json\n" + text[:cut].rstrip().rstrip(",") + ",\n"
+
+        usage = Usage(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+        return LLMResponse(text=text, usage_metadata=usage)
+
+    async def generate(self, prompt: str, generation_config: dict) -> LLMResponse:
+        await asyncio.sleep(self._latency())
+        return self._respond(prompt, generation_config)
+
+    async def stream(self, prompt: str, generation_config: dict) -> AsyncIterator[LLMResponse]:
+        latency = self._latency()
+        response = self._respond(prompt, generation_config)
+        chunks = [
+            response.text[i:i + self.chunk_chars] for i in range(0, len(response.text), self.chunk_chars)
+        ] or [""]
+
+        # Spread the latency over the chunks, as a real stream would
+        for index, chunk in enumerate(chunks):
+            await asyncio.sleep(latency / len(chunks))
+            last = index == len(chunks) - 1
+            yield LLMResponse(text=chunk, usage_metadata=response.usage_metadata if last else None)
+
+
+def _compact(value):
+    # Rename public field names to the short keys compact prompts ask for
+    if isinstance(value, dict):
+        return {COMPACT_KEYS.get(key, key): _compact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
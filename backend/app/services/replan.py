@@ -0,0 +1,166 @@
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from ..models import ReplanRequest, TravelRequest
+from .plan_cache import trip_days
+
+# Request fields a re-plan may change
+REQUEST_FIELDS = {"source", "destination", "start_date", "end_date", "budget", "travelers", "interests"}
+
+
+@dataclass
+class ReplanScope:
+    """
+    The parts of a plan a re-plan has to regenerate. Everything else is kept.
+    """
+    full: bool = False
+    days: List[int] = field(default_factory=list)
+    added_interests: List[str] = field(default_factory=list)
+    accommodation: int = 0
+
+
+def apply_delta(request: TravelRequest, delta: ReplanRequest) -> TravelRequest:
+    """
+    The original request with the fields set in the delta replaced.
+    """
+    changes = delta.dict(include=REQUEST_FIELDS, exclude_none=True)
+    return TravelRequest(**{**request.dict(), **changes})
+
+
+def _dates(request: TravelRequest) -> List[str]:
+    start, end = date.fromisoformat(request.start_date), date.fromisoformat(request.end_date)
+    return [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+
+
+def realign_itinerary(plan: dict, old_request: TravelRequest, new_request: TravelRequest) -> List[int]:
+    """
+    Fit the plan's itinerary to the new trip dates in place and return the day
+    numbers that have no existing plan. When the old and new dates overlap, days
+    are kept by date (moving the end date only adds or drops days at the end);
+    otherwise they are kept by position and re-dated.
+    """
+    old_days = [day for day in plan.get("itinerary") or [] if isinstance(day, dict)]
+    new_dates = _dates(new_request)
+    by_date = {day.get("date"): day for day in old_days}
+    keep_by_date = bool(set(new_dates) & set(_dates(old_request)))
+
+    itinerary, missing = [], []
+    for offset, day_date in enumerate(new_dates):
+        number = offset + 1
+        if keep_by_date:
+            existing = by_date.get(day_date)
+        else:
+            existing = old_days[offset] if offset < len(old_days) else None
+
+        if existing is None:
+            itinerary.append({"day": number, "date": day_date, "title": None, "activities": []})
+            missing.append(number)
+        else:
+            itinerary.append({**existing, "day": number, "date": day_date})
+
+    plan["itinerary"] = itinerary
+    return missing
+
+
+def _mentions(day: dict, interest: str) -> bool:
+    text = " ".join(str(value) for value in [day.get("title")] + list(day.get("activities") or []))
+    return interest.casefold() in text.casefold()
+
+
+def _days_for_interests(itinerary: List[dict], added: List[str], removed: List[str], taken: List[int]) -> List[int]:
+    """
+    Days to rework for changed interests: every day built around a removed
+    interest, plus the least busy day for each added one (arrival and departure
+    days last).
+    """
+    chosen = [
+        day["day"] for day in itinerary
+        if day["day"] not in taken and any(_mentions(day, interest) for interest in removed)
+    ]
+
+    last = len(itinerary)
+    candidates = sorted(
+        (day for day in itinerary if day["day"] not in taken and day["day"] not in chosen),
+        key=lambda day: (day["day"] in (1, last) and last > 2, len(day.get("activities") or []), day["day"]),
+    )
+    chosen.extend(day["day"] for day in candidates[:len(added)])
+    return chosen
+
+
+def _drop_activities(plan: dict, removed: List[str]) -> None:
+    removed = [interest.casefold() for interest in removed]
+    plan["activities"] = [
+        activity for activity in plan.get("activities") or []
+        if not (isinstance(activity, dict) and str(activity.get("category", "")).casefold() in removed)
+    ]
+
+
+def _drop_accommodation(plan: dict, names: List[str]) -> int:
+    names = {name.strip().casefold() for name in names}
+    stays = plan.get("accommodation_suggestions") or []
+    kept = [
+        stay for stay in stays
+        if not (isinstance(stay, dict) and str(stay.get("name", "")).strip().casefold() in names)
+    ]
+    plan["accommodation_suggestions"] = kept
+    return len(stays) - len(kept)
+
+
+def prepare_replan(
+    plan: dict, old_request: TravelRequest, new_request: TravelRequest, delta: ReplanRequest
+) -> ReplanScope:
+    """
+    Work out what a delta invalidates and strip it from the plan in place.
+
+    A new source or destination, or an original request whose dates can't be
+    parsed, needs a whole new plan. New dates add or drop
+    itinerary days, changed interests rework the affected days and activity
+    recommendations, and swapped hotels are replaced one for one. Budget and
+    traveler changes only affect costs, which are always recomputed locally.
+    """
+    if (new_request.source.strip().casefold() != old_request.source.strip().casefold()
+            or new_request.destination.strip().casefold() != old_request.destination.strip().casefold()
+            or not (trip_days(old_request) or 0) > 0):
+        return ReplanScope(full=True)
+
+    scope = ReplanScope()
+    days = realign_itinerary(plan, old_request, new_request)
+
+    old_interests = {interest.casefold(): interest for interest in old_request.interests}
+    new_interests = {interest.casefold(): interest for interest in new_request.interests}
+    added = [interest for key, interest in new_interests.items() if key not in old_interests]
+    removed = [interest for key, interest in old_interests.items() if key not in new_interests]
+    if added or removed:
+        days += _days_for_interests(plan["itinerary"], added, removed, days)
+        _drop_activities(plan, removed)
+    scope.added_interests = added
+
+    last = len(plan["itinerary"])
+    days += [number for number in delta.regenerate_days if 1 <= number <= last]
+    scope.days = sorted(set(days))
+
+    # Regenerated days are rewritten from scratch, title included
+    by_number: Dict[int, dict] = {day["day"]: day for day in plan["itinerary"]}
+    for number in scope.days:
+        by_number[number].update({"title": None, "activities": []})
+
+    if delta.replace_accommodation:
+        scope.accommodation = _drop_accommodation(plan, delta.replace_accommodation)
+
+    return scope
+
+
+def merge_days(plan: dict, generated: List[dict], numbers: List[int]) -> None:
+    """
+    Put regenerated days back into the itinerary by day number, keeping their dates.
+    """
+    wanted = set(numbers)
+    detailed: Dict[int, dict] = {}
+    for day in generated:
+        if isinstance(day, dict) and day.get("day") in wanted:
+            detailed[day["day"]] = day
+
+    for index, day in enumerate(plan["itinerary"]):
+        update: Optional[dict] = detailed.get(day["day"])
+        if update is not None:
+            plan["itinerary"][index] = {**day, **update, "day": day["day"], "date": day["date"]}
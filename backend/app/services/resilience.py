@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling the upstream while the circuit breaker is open.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__("The AI provider is currently unavailable")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls fail
+    fast for `reset_timeout` seconds. Then a single trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self) -> None:
+        """
+        Fail fast while open, without claiming the half-open trial call.
+        """
+        if self.state == "open" and self.failure_threshold > 0:
+            raise CircuitOpen(max(self.reset_timeout - (time.monotonic() - self.opened_at), 1.0))
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "closed" or self.failure_threshold <= 0:
+            return
+        if state == "half_open" and not self._trial_in_progress:
+            self._trial_in_progress = True
+            return
+        elapsed = time.monotonic() - self.opened_at
+        raise CircuitOpen(max(self.reset_timeout - elapsed, 1.0))
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+
+    def abandon(self) -> None:
+        """
+        Release the half-open trial slot when a call ends without an outcome (e.g. cancelled).
+        """
+        self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_progress = False
+        if self.failure_threshold > 0 and (self.failures >= self.failure_threshold or self.opened_at is not None):
+            self.opened_at = time.monotonic()
+
+
+async def retry_with_backoff(
+    attempt: Callable[[], Awaitable[Any]],
+    retries: int,
+    base_delay: float,
+    max_delay: float,
+    is_retryable: Callable[[Exception], bool],
+    on_retry: Optional[Callable[[Exception, int], None]] = None,
+) -> Any:
+    """
+    Run `attempt`, retrying retryable failures up to `retries` times with
+    full-jitter exponential backoff.
+    """
+    for number in range(retries + 1):
+        try:
+            return await attempt()
+        except Exception as e:
+            if number == retries or not is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e, number + 1)
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** number)))
+
+
+async def hedge(
+    attempt: Callable[[], Awaitable[Any]],
+    delay: Optional[float],
+    on_hedge: Optional[Callable[[], None]] = None,
+) -> Any:
+    """
+    Run `attempt`; if it hasn't finished after `delay` seconds, start a second
+    copy and return whichever succeeds first, cancelling the other. If one copy
+    fails, the other is still awaited. A delay of None disables hedging.
+    """
+    if delay is None:
+        return await attempt()
+
+    tasks = [asyncio.ensure_future(attempt())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            if on_hedge is not None:
+                on_hedge()
+            tasks.append(asyncio.ensure_future(attempt()))
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # Cancel the losing copy, or both if our caller went away
+        for task in tasks:
+            if not task.done():
+                task.cancel()
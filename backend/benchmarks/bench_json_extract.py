@@ -0,0 +1,115 @@
+"""
+Micro-benchmark: JSON extraction and repair vs the old strip + regex cleanup.
+
+Compares the legacy cleanup + json.loads against parse_llm_json (raw_decode
+fast path) and the single-pass extract_json scanner on its own.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_json_extract
+"""
+import json
+import re
+import timeit
+from app.services.json_repair import extract_json, parse_llm_json
+
+
+def legacy_clean(response_text: str) -> str:
+    # The cleanup AIService.clean_ai_response used before the single-pass extractor
+    cleaned_text = response_text.strip()
+    if cleaned_text.startswith("```json"):
+        cleaned_text = cleaned_text[7:]
+    if cleaned_text.endswith("```"):
+        cleaned_text = cleaned_text[:-3]
+    match = re.search(r'({[\s\S]*})', cleaned_text)
+    if match:
+        cleaned_text = match.group(1)
+    return cleaned_text.strip()
+
+
+def make_plan(days: int) -> dict:
+    return {
+        "itinerary": [
+            {
+                "day": day,
+                "date": f"2024-01-{day:02d}",
+                "title": f"Day {day} {{exploring}}",
+                "activities": [f"Activity {i} at spot \"{day}-{i}\", with {{braces}}" for i in range(6)],
+            }
+            for day in range(1, days + 1)
+        ],
+        "accommodation_suggestions": [
+            {"name": f"Hotel {i}", "type": "Hotel", "price_per_night": "₹3,500", "description": "Near the beach"}
+            for i in range(5)
+        ],
+        "transportation_options": [
+            {"type": "Flight", "from": "Delhi", "to": "Goa", "estimated_price": "₹6,000", "details": "Direct"}
+            for _ in range(4)
+        ],
+        "estimated_costs": {
+            "accommodation": "₹17,500", "transportation": "₹12,000", "activities": "₹5,000",
+            "food": "₹6,000", "miscellaneous": "₹9,500", "total": "₹50,000",
+        },
+        "activities": [
+            {"name": f"Activity {i}", "category": "culture", "description": "A good one"} for i in range(30)
+        ],
+    }
+
+
+def build_cases() -> dict:
+    small = json.dumps(make_plan(5), ensure_ascii=False, indent=2)
+    large = json.dumps(make_plan(21), ensure_ascii=False, indent=2)
+    return {
+        "fenced 5-day plan": f"```json\n{small}\n```",
+        "3-week plan + trailing prose": f"Here is your plan:\n{large}\nNote: prices are estimates {{approx}}.",
+        "trailing commas": small.replace("\n  ]", ",\n  ]"),
+        "truncated 3-week plan": large[: int(len(large) * 0.8)],
+        "20k unmatched braces": "{" + "{" * 20000,
+    }
+
+
+def legacy_parse(text: str):
+    return json.loads(legacy_clean(text))
+
+
+def repair_parse(text: str):
+    return parse_llm_json(text)[0]
+
+
+def scanner_parse(text: str):
+    return json.loads(extract_json(text)[0], strict=False)
+
+
+def measure(parse, text: str, number: int):
+    try:
+        parse(text)
+    except (json.JSONDecodeError, ValueError):
+        ok = False
+    else:
+        ok = True
+
+    def run():
+        try:
+            parse(text)
+        except (json.JSONDecodeError, ValueError):
+            pass
+
+    return timeit.timeit(run, number=number) / number * 1e6, ok
+
+
+def main(number: int = 50):
+    columns = [("legacy", legacy_parse), ("parse_llm_json", repair_parse), ("extract_json", scanner_parse)]
+    header = "".join(f"{name + ' µs':>20} {'ok':>5}" for name, _ in columns)
+    print(f"{'case':30} {'size':>8}{header}")
+    for name, text in build_cases().items():
+        row = f"{name:30} {len(text):>8}"
+        for column, parse in columns:
+            # The legacy regex is quadratic on unmatched braces; one run is plenty
+            runs = 1 if column == "legacy" and "unmatched" in name else number
+            micros, ok = measure(parse, text, runs)
+            row += f"{micros:>20.1f} {str(ok):>5}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+End-to-end benchmark of the plan-generation pipeline, fully offline.
+
+Drives app.main:app in-process over httpx against a corpus of recorded
+TravelRequests and model responses, replayed from cassettes with no upstream
+latency (unless --latency is given), so the numbers are our own code paths:
+routing, prompt building, JSON repair and parsing, cost computation,
+validation and serialization.
+
+The corpus directory holds requests.jsonl plus one cassette file per recorded
+response. If it has no requests.jsonl, a synthetic corpus is recorded into it
+first: trips of 2 to 21 days, some with very large responses, and a share of
+fenced, truncated outputs that need repair. A directory recorded from Gemini
+with LLM_PROVIDER=record (plus a requests.jsonl) is replayed as-is.
+
+For each concurrency level it reports requests/sec, p50/p95/p99 latency, CPU
+time per request and time per pipeline stage; it then measures the CPU time of
+prompt building, clean_ai_response, json.loads and TravelPlan validation in
+isolation. Results are written to a JSON file; pass --compare with an earlier
+file to print the change.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_pipeline [--concurrency 1,8,64,512] [--requests 512]
+        [--corpus DIR] [--latency 0] [--output bench_pipeline.json] [--compare OLD.json]
+"""
+import os
+import tempfile
+
+# The benchmark measures the pipeline, not quota enforcement, hedging or logging
+os.environ.setdefault("LLM_PROVIDER", "replay")
+os.environ.setdefault("GEMINI_RPM", "0")
+os.environ.setdefault("GEMINI_TPM", "0")
+os.environ.setdefault("GEMINI_MAX_CONCURRENCY", "1024")
+os.environ.setdefault("PLAN_HEDGE_DELAY", "off")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+# The corpus' very large responses are deliberately longer than any output budget
+os.environ.setdefault("PROMPT_OUTPUT_BUDGET", "off")
+# Keep benchmark plans out of the real plan store
+os.environ.setdefault("PLAN_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="plan-store-"), "plans.db"))
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from app.main import create_app
+from app.models import TravelPlan, TravelRequest
+from app.services.ai_service import AIService
+from app.services.catalog import match_request
+from app.services.cost_engine import compute_cost_breakdown
+from app.services.json_repair import parse_llm_json
+from app.services.metrics import STAGE_SECONDS
+from app.services.plan_cache import PlanCache, trip_days
+from app.services.prompt_compiler import expand_response
+from app.services.providers import CassetteProvider, LLMProvider, SyntheticProvider
+
+STAGES = ["queue_wait", "upstream", "prompt_build", "json_parse", "cost_breakdown", "validation", "serialization"]
+
+DESTINATIONS = ["Goa", "Jaipur", "Manali", "Kerala", "Varanasi", "Rishikesh", "Udaipur", "Leh", "Andaman Islands"]
+SOURCES = ["Delhi", "Mumbai", "Bengaluru", "Kolkata", "Chennai"]
+INTERESTS = ["beaches", "food", "culture", "history", "adventure", "nature", "nightlife", "shopping"]
+TRIP_DAYS = [2, 3, 5, 7, 10, 14, 21]
+
+
+class NoCoalescing:
+    """
+    Stand-in for SingleFlight that runs every request's own generation.
+    """
+
+    deduplicated = 0
+
+    async def do(self, key, fn):
+        return await fn()
+
+    def in_flight(self) -> int:
+        return 0
+
+
+class DelayedProvider(LLMProvider):
+    """
+    Adds a fixed upstream latency to another provider.
+    """
+
+    name = "delayed"
+
+    def __init__(self, inner: LLMProvider, latency: float):
+        self.inner = inner
+        self.latency = latency
+
+    async def generate(self, prompt: str, generation_config: dict):
+        await asyncio.sleep(self.latency)
+        return await self.inner.generate(prompt, generation_config)
+
+    async def stream(self, prompt: str, generation_config: dict):
+        await asyncio.sleep(self.latency)
+        async for chunk in self.inner.stream(prompt, generation_config):
+            yield chunk
+
+
+def make_requests(count: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    requests = []
+    for index in range(count):
+        start = date(2025, 1, 1) + timedelta(days=rng.randrange(365))
+        days = TRIP_DAYS[index % len(TRIP_DAYS)]
+        requests.append({
+            "source": rng.choice(SOURCES),
+            "destination": rng.choice(DESTINATIONS),
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=days - 1)).isoformat(),
+            "budget": rng.randrange(20_000, 300_000, 5_000),
+            "travelers": rng.randint(1, 6),
+            "interests": rng.sample(INTERESTS, 3),
+        })
+    return requests
+
+
+async def record_corpus(corpus: str, count: int, seed: int) -> None:
+    """
+    Record a synthetic corpus by running each request through the pipeline once.
+    Every fourth request gets a very large response and a fifth of all
+    responses are malformed.
+    """
+    requests = make_requests(count, seed)
+    for index, request in enumerate(requests):
+        large = index % 4 == 3
+        AIService._provider = CassetteProvider(corpus, mode="record", inner=SyntheticProvider(
+            latency_median=0,
+            activities_per_day=10 if large else 4,
+            description_words=80 if large else 20,
+            malformed_rate=0.2,
+            seed=seed + index,
+        ))
+        try:
+            await AIService.generate_travel_plan(TravelRequest(**request))
+        except HTTPException:
+            # Unrecoverable output stays in the corpus and is counted as an error on replay
+            pass
+
+    with open(os.path.join(corpus, "requests.jsonl"), "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+
+
+def load_corpus(corpus: str):
+    with open(os.path.join(corpus, "requests.jsonl"), encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+
+    prompts, responses = [], []
+    for name in sorted(os.listdir(corpus)):
+        if name.endswith(".json"):
+            with open(os.path.join(corpus, name), encoding="utf-8") as f:
+                recording = json.load(f)
+            prompts.append(recording["prompt"])
+            responses.append(recording["text"])
+    return requests, prompts, responses
+
+
+def needs_repair(text: str) -> bool:
+    try:
+        return parse_llm_json(text)[1]
+    except (json.JSONDecodeError, ValueError):
+        return True
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def run_level(client: httpx.AsyncClient, requests: List[dict], concurrency: int, total: int) -> dict:
+    """
+    Send `total` requests, cycling through the corpus, from `concurrency` workers.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(total):
+        queue.put_nowait(requests[index % len(requests)])
+
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            body = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post("/travel/generate-plan", json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    stages_before = {name: STAGE_SECONDS.total(stage=name) for name in STAGES}
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "cpu_ms_per_request": round(cpu / total * 1000, 3),
+        "stage_ms_per_request": {
+            name: round((STAGE_SECONDS.total(stage=name) - stages_before[name]) / total * 1000, 3)
+            for name in STAGES
+        },
+    }
+
+
+def cpu_time(fn, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "calls": len(samples),
+        "mean_us": round(statistics.mean(samples) * 1e6, 1),
+        "p95_us": round(percentile(samples, 0.95) * 1e6, 1),
+        "total_ms": round(sum(samples) * 1000, 3),
+    }
+
+
+def measure_stages(requests: List[dict], prompts: List[str], responses: List[str], repeat: int) -> dict:
+    """
+    CPU time of the individual pipeline stages over the whole corpus.
+    """
+    builds, cleans, loads, validations = [], [], [], []
+
+    # Whole-plan and outline prompts, to find the request each plan answers
+    plan_requests = {}
+    for body in requests:
+        request = TravelRequest(**body)
+        builds.append(cpu_time(lambda: AIService.generate_travel_plan_prompt(request), repeat))
+        plan_requests[AIService.generate_travel_plan_prompt(request)] = request
+        plan_requests[AIService.generate_skeleton_prompt(request)] = request
+
+    for prompt, text in zip(prompts, responses):
+        cleaned = AIService.clean_ai_response(text)
+        cleans.append(cpu_time(lambda: AIService.clean_ai_response(text), repeat))
+        try:
+            plan = json.loads(cleaned, strict=False)
+        except json.JSONDecodeError:
+            continue
+        loads.append(cpu_time(lambda: json.loads(cleaned, strict=False), repeat))
+
+        # Day-block responses are not whole plans
+        request = plan_requests.get(prompt)
+        if request is None or "itinerary" not in plan:
+            continue
+        # Catalog plans carry activity IDs and no accommodation until expanded
+        plan = expand_response(plan)
+        catalog = match_request(request)
+        if catalog is not None:
+            catalog.expand(plan, request)
+        plan["estimated_costs"] = compute_cost_breakdown(plan, request.budget, request.travelers, trip_days(request))
+        try:
+            # Drops partial entries left by repaired truncations, as the service does
+            AIService.validate_plan(plan)
+        except HTTPException:
+            continue
+        validations.append(cpu_time(lambda: TravelPlan.parse_obj(plan), repeat))
+
+    return {
+        "prompt_build": summarize(builds),
+        "clean_ai_response": summarize(cleans),
+        "json_loads": summarize(loads),
+        "validation": summarize(validations),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, previous_path: str) -> None:
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {level["concurrency"]: level for level in json.load(f)["levels"]}
+
+    print(f"\nvs {previous_path}:")
+    for level in results["levels"]:
+        old = previous.get(level["concurrency"])
+        if old is None:
+            continue
+        rps = (level["requests_per_second"] / old["requests_per_second"] - 1) * 100
+        p95 = (level["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1) * 100
+        print(f"  c={level['concurrency']:<4} req/s {rps:+6.1f}%   p95 {p95:+6.1f}%")
+
+
+async def run(args) -> dict:
+    corpus = args.corpus or tempfile.mkdtemp(prefix="plan-corpus-")
+    os.makedirs(corpus, exist_ok=True)
+
+    # Every request runs the whole pipeline unless asked otherwise
+    if not args.cache:
+        AIService.cache = PlanCache(max_entries=0, ttl=0)
+    if not args.coalesce:
+        AIService.inflight = NoCoalescing()
+
+    if not os.path.exists(os.path.join(corpus, "requests.jsonl")):
+        await record_corpus(corpus, args.corpus_size, args.seed)
+    requests, prompts, responses = load_corpus(corpus)
+
+    provider: LLMProvider = CassetteProvider(corpus, mode="replay")
+    if args.latency:
+        provider = DelayedProvider(provider, args.latency)
+    AIService._provider = provider
+
+    app = create_app()
+    levels = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # Warm up imports and code paths before measuring
+        await run_level(client, requests, 1, len(requests))
+
+        for concurrency in args.concurrency:
+            level = await run_level(client, requests, concurrency, max(args.requests, concurrency))
+            levels.append(level)
+            print(
+                f"c={concurrency:<4} {level['requests_per_second']:>8.1f} req/s   "
+                f"p50 {level['latency_ms']['p50']:>8.2f} ms   p95 {level['latency_ms']['p95']:>8.2f} ms   "
+                f"p99 {level['latency_ms']['p99']:>8.2f} ms   cpu {level['cpu_ms_per_request']:.2f} ms/req   "
+                f"errors {level['errors']}"
+            )
+
+    stage_cpu = measure_stages(requests, prompts, responses, args.repeat)
+    print("\nCPU time per call (isolated):")
+    for name, summary in stage_cpu.items():
+        print(f"  {name:18} {summary['mean_us']:>10.1f} µs mean   {summary['p95_us']:>10.1f} µs p95   ({summary['calls']} calls)")
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "corpus": corpus,
+            "latency": args.latency,
+            "cache": args.cache,
+            "coalesce": args.coalesce,
+            "requests_per_level": args.requests,
+        },
+        "corpus": {
+            "requests": len(requests),
+            "responses": len(responses),
+            "largest_response_chars": max(len(text) for text in responses),
+            "malformed_responses": sum(1 for text in responses if needs_repair(text)),
+        },
+        "levels": levels,
+        "stage_cpu": stage_cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,64,512",
+                        type=lambda value: [int(level) for level in value.split(",")])
+    parser.add_argument("--requests", type=int, default=512, help="requests per concurrency level")
+    parser.add_argument("--corpus", help="corpus directory (recorded here if it has no requests.jsonl)")
+    parser.add_argument("--corpus-size", type=int, default=28, help="requests in a newly recorded corpus")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated upstream seconds per call")
+    parser.add_argument("--cache", action="store_true", help="keep the plan cache enabled")
+    parser.add_argument("--coalesce", action="store_true", help="keep request coalescing enabled")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions per isolated stage measurement")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Micro-benchmark: prompt size, prompt build time and response size of the
+compiled prompts, fully offline.
+
+Compares, for trips of several lengths:
+
+- legacy: the whitespace-heavy f-string prompt rebuilt on every call, with no
+  output budget (how plans were requested before the prompt compiler)
+- compiled: the precompiled, stripped template with an output budget
+- compact: the same with the key-minified response schema
+
+Prompt tokens are estimated as characters / 4. Response tokens come from the
+synthetic provider answering each prompt, and the decode time is estimated
+from them at --tokens-per-second, since generation time grows with output
+length. Build times are microseconds against seconds of generation; the
+compiled prompts also size the output budget and field counts per trip.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_prompts [--days 2,5,10,21] [--repeat 2000] [--tokens-per-second 80]
+"""
+import os
+
+os.environ.setdefault("LLM_PROVIDER", "synthetic")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import Callable
+
+from app.models import TravelRequest
+from app.services.ai_service import GENERATION_CONFIG, AIService
+from app.services.catalog import match_request
+from app.services.plan_cache import trip_days
+from app.services.prompt_compiler import plan_entries
+from app.services.providers import SyntheticProvider
+
+
+def legacy_prompt(request: TravelRequest) -> str:
+    # generate_travel_plan_prompt as it was before the prompt compiler
+    match_request(request)
+    return f"""
+        Create a detailed travel plan with the following information:
+
+        Source: {request.source}
+        Destination: {request.destination}
+        Dates: {request.start_date} to {request.end_date}
+        Budget: ₹{request.budget}
+        Number of travelers: {request.travelers}
+        Interests: {', '.join(request.interests)}
+
+        Please provide:
+        1. Day-by-day itinerary
+        2. Accommodation suggestions
+        3. Transportation options
+        4. Activity recommendations based on the interests
+
+        Format the response as clean structured JSON with the following fields:
+        - itinerary: Array of daily plans with 'day', 'date', 'title' (optional), and 'activities' array
+        - accommodation_suggestions: Array of places to stay with 'name', 'type', 'price_per_night' (per room), and 'description'
+        - transportation_options: Array of ways to travel with 'type', 'from', 'to', 'estimated_price' (per person), and 'details'
+        - activities: Array of recommended activities with 'name', 'category', 'description', and 'estimated_cost' (per person)
+
+        Use Indian Rupees (₹) for all monetary values.
+        Important: Respond with ONLY the JSON object. Do not include any additional notes, explanations, or markdown formatting outside the JSON.
+        """
+
+
+def make_request(days: int) -> TravelRequest:
+    # A destination outside the catalog, so every variant asks for full entries
+    start = date(2024, 11, 1)
+    return TravelRequest(
+        source="Delhi", destination="Pondicherry",
+        start_date=start.isoformat(), end_date=(start + timedelta(days=days - 1)).isoformat(),
+        budget=80000, travelers=2, interests=["food", "culture", "beaches"],
+    )
+
+
+def build_time(build: Callable[[], str], repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        build()
+    return (time.process_time() - start) / repeat
+
+
+async def response_tokens(prompt: str, config: dict) -> int:
+    provider = SyntheticProvider(latency_median=0, seed=7)
+    response = await provider.generate(prompt, config)
+    return response.usage_metadata.candidates_token_count
+
+
+async def run(args) -> None:
+    print(f"{'days':>4} {'variant':10} {'prompt tok':>10} {'build µs':>9} {'budget':>7} {'output tok':>10} {'decode s':>9} {'vs legacy':>10}")
+    for days in args.days:
+        request = make_request(days)
+        entries = plan_entries(trip_days(request), catalog=False, outline=False)
+        variants = [
+            ("legacy", lambda: legacy_prompt(request), GENERATION_CONFIG),
+            ("compiled", lambda: AIService.generate_travel_plan_prompt(request, compact=False),
+             AIService.generation_config(entries, compact=False)),
+            ("compact", lambda: AIService.generate_travel_plan_prompt(request, compact=True),
+             AIService.generation_config(entries, compact=True)),
+        ]
+        baseline = None
+        for name, build, config in variants:
+            prompt = build()
+            seconds = build_time(build, args.repeat)
+            tokens = await response_tokens(prompt, config)
+            total = len(prompt) // 4 + tokens
+            baseline = baseline or total
+            print(
+                f"{days:>4} {name:10} {len(prompt) // 4:>10} {seconds * 1e6:>9.1f} "
+                f"{config.get('max_output_tokens', '-'):>7} {tokens:>10} {tokens / args.tokens_per_second:>9.1f} "
+                f"{(1 - total / baseline) * 100:>9.1f}%"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=lambda value: [int(day) for day in value.split(",")], default=[2, 5, 10, 21],
+                        help="comma-separated trip lengths")
+    parser.add_argument("--repeat", type=int, default=2000, help="prompt builds timed per variant")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="assumed model decode rate")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
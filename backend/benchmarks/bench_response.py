@@ -0,0 +1,130 @@
+"""
+Micro-benchmark: CPU per plan response, from the finished plan dict to the
+response body, on large 3-week itineraries.
+
+Compares three ways of turning a plan into a response:
+
+- fastapi default: the route validates into the untyped TravelPlan, then FastAPI
+  validates it again for response_model, runs jsonable_encoder and renders with
+  the stdlib json module
+- validated once: the untyped TravelPlan validated once, .dict() and json.dumps
+  (how the routes served plans before the typed models)
+- typed + orjson: the typed TravelPlan validated once in the service and
+  serialized with orjson, as the routes do now
+
+Plans are generated offline by the synthetic provider through the normal
+pipeline (catalog expansion, cost breakdown), so they have the real shape.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_response [--days 21] [--plans 10] [--repeat 50]
+"""
+import os
+
+os.environ.setdefault("LLM_PROVIDER", "synthetic")
+os.environ.setdefault("SYNTHETIC_LATENCY_MEDIAN", "0")
+os.environ.setdefault("GEMINI_RPM", "0")
+os.environ.setdefault("GEMINI_TPM", "0")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+
+from app.models import TravelPlan, TravelRequest
+from app.services.ai_service import AIService
+from app.services.plan_store import serialize_plan
+from app.services.providers import SyntheticProvider
+
+DESTINATIONS = ["Goa", "Jaipur", "Manali", "Kerala", "Leh"]
+
+
+class UntypedTravelPlan(BaseModel):
+    # TravelPlan as it was before the typed section models
+    itinerary: List[Dict[str, Any]]
+    accommodation_suggestions: List[Dict[str, Any]]
+    transportation_options: List[Dict[str, Any]]
+    estimated_costs: Dict[str, Any]
+    activities: List[Dict[str, Any]]
+    plan_id: Optional[str] = None
+
+
+async def make_plans(days: int, count: int) -> List[dict]:
+    AIService._provider = SyntheticProvider(
+        latency_median=0, activities_per_day=6, description_words=40, seed=7,
+    )
+    start = date(2024, 11, 1)
+    plans = []
+    for index in range(count):
+        request = TravelRequest(
+            source="Delhi", destination=DESTINATIONS[index % len(DESTINATIONS)],
+            start_date=start.isoformat(), end_date=(start + timedelta(days=days - 1)).isoformat(),
+            budget=150000 + index * 1000, travelers=2, interests=["food", "culture", "nature"],
+        )
+        plan = await AIService.generate_travel_plan(request)
+        plan.plan_id = f"plan{index}"
+        plans.append(orjson.loads(serialize_plan(plan)))
+    return plans
+
+
+async def fastapi_default(plan: dict) -> bytes:
+    validated = UntypedTravelPlan.parse_obj(plan)
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=validated)
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+async def validated_once(plan: dict) -> bytes:
+    validated = UntypedTravelPlan.parse_obj(plan)
+    return json.dumps(validated.dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+async def typed_orjson(plan: dict) -> bytes:
+    return serialize_plan(TravelPlan.parse_obj(plan)).encode("utf-8")
+
+
+RESPONSE_FIELD = create_response_field(name="response", type_=UntypedTravelPlan)
+
+
+async def cpu_per_response(path, plans: List[dict], repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        for plan in plans:
+            await path(plan)
+    return (time.process_time() - start) / (repeat * len(plans))
+
+
+async def run(args) -> None:
+    plans = await make_plans(args.days, args.plans)
+    size = sum(len(orjson.dumps(plan)) for plan in plans) / len(plans)
+    print(f"{len(plans)} plans of {args.days} days, {size / 1024:.1f} KiB of JSON each\n")
+
+    columns = [("fastapi default", fastapi_default), ("validated once", validated_once), ("typed + orjson", typed_orjson)]
+    baseline = None
+    print(f"{'path':20} {'µs/response':>12} {'vs default':>11}")
+    for name, path in columns:
+        # Warm up, then measure
+        await cpu_per_response(path, plans, 1)
+        seconds = await cpu_per_response(path, plans, args.repeat)
+        baseline = baseline or seconds
+        print(f"{name:20} {seconds * 1e6:>12.1f} {(1 - seconds / baseline) * 100:>10.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=21, help="trip length of the generated plans")
+    parser.add_argument("--plans", type=int, default=10, help="distinct plans to serialize")
+    parser.add_argument("--repeat", type=int, default=50, help="passes over the plans per path")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
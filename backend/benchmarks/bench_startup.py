@@ -0,0 +1,71 @@
+"""
+Import-time budget for the API: how long a fresh worker takes to import
+app.main and build the application.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_startup [--runs 5] [--budget 0.5]
+
+Exits non-zero if the median exceeds the budget or if the Gemini SDK was
+imported eagerly.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Executed in a fresh interpreter so nothing is already imported
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+app.main.create_app()
+built = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "create_app_seconds": built - imported,
+    "sdk_loaded": "google.generativeai" in sys.modules,
+}))
+"""
+
+
+def measure(runs: int) -> list:
+    # Startup must not depend on having an API key
+    env = {name: value for name, value in os.environ.items() if name != "GEMINI_API_KEY"}
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            capture_output=True, text=True, check=True,
+            env=env,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.5, help="seconds allowed for import + create_app")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    import_median = statistics.median(r["import_seconds"] for r in results)
+    build_median = statistics.median(r["create_app_seconds"] for r in results)
+    total = import_median + build_median
+    sdk_loaded = any(r["sdk_loaded"] for r in results)
+
+    print(f"import app.main: {import_median * 1000:.1f} ms (median of {args.runs})")
+    print(f"create_app():    {build_median * 1000:.1f} ms")
+    print(f"total:           {total * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+    print(f"Gemini SDK imported at startup: {sdk_loaded}")
+
+    if sdk_loaded or total > args.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Production entry point: `python serve.py`.
+# Runs several uvicorn worker processes with reload off. Worker processes share
+# the plan cache, the upstream quota buckets, the plan store, the batch job
+# queue and their metrics through SQLite files (WAL mode), so adding workers
+# doesn't add cold caches or multiply quota use, and /metrics reports totals
+# for the whole server. run.py stays the single-process dev server.
+import os
+import importlib.util
+import uvicorn
+from dotenv import load_dotenv
+
+# Shared state files used unless the environment names others
+SHARED_STATE_DEFAULTS = {
+    "PLAN_CACHE_PATH": "plan_cache.db",
+    "ADMISSION_STATE_PATH": "admission.db",
+    "JOB_QUEUE": "sqlite",
+    "METRICS_STATE_PATH": "metrics.db",
+}
+
+
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main():
+    # Read .env here so its values win over the defaults below, and workers inherit both
+    load_dotenv()
+    for name, value in SHARED_STATE_DEFAULTS.items():
+        if not os.getenv(name):
+            os.environ[name] = value
+
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1),
+        loop="uvloop" if installed("uvloop") else "asyncio",
+        http="httptools" if installed("httptools") else "h11",
+        timeout_keep_alive=int(os.getenv("KEEPALIVE_TIMEOUT", "5")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        reload=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
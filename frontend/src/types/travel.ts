@@ -47,6 +47,15 @@ export interface CostBreakdown {
   food: string;
   miscellaneous?: string;
   total: string;
+  // Numeric values computed by the backend cost engine
+  accommodation_amount?: number;
+  transportation_amount?: number;
+  activities_amount?: number;
+  food_amount?: number;
+  miscellaneous_amount?: number;
+  total_amount?: number;
+  budget_amount?: number;
+  over_budget?: boolean;
 }
 
 export interface Activity {
@@ -65,4 +74,6 @@ export interface TravelPlan {
   estimated_costs: CostBreakdown;
   activities: Activity[];
   travelers?: number;
+  // Id of the stored plan, fetchable from /travel/plans/{plan_id}
+  plan_id?: string;
 } 
\ No newline at end of file